@@ -0,0 +1,32 @@
+# Gunicorn settings for serving the dashboard from the repository root:
+#   gunicorn -c gunicorn.conf.py
+#
+# The app is imported once in the master process before the workers are
+# forked (preload_app), so the dataset's memory-mapped column files and any
+# pre-warmed chart cache are shared read-only between workers instead of
+# being loaded once per worker.
+
+import os
+
+
+wsgi_app = 'app:server'
+pythonpath = 'src'
+bind = f'0.0.0.0:{os.environ.get("PORT", 8050)}'
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+preload_app = True
+
+# Chart requests wait on the app's render queue (app.request_render), which
+# only coalesces and skips renders between requests in the same process.
+# Sync workers serve one request at a time, so each worker needs threads
+# for concurrent and superseded requests to meet in its queue. Renders
+# still run on the queue's RENDER_WORKERS threads, so waiting request
+# threads do not add CPU load.
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+
+
+def pre_fork(server, worker):
+    # The app loads the dataset in a background thread. Fork only once it
+    # has finished, so workers share it and no thread is mid-import.
+    import app
+    app.wait_loaded()
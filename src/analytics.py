@@ -0,0 +1,234 @@
+"""
+Dense player x round x stat representation of players-df, vectorized
+per-player metrics computed from it and projected points over upcoming
+fixtures.
+"""
+import numpy as np
+import pandas as pd
+
+
+# Declare constants
+HORIZON = 5 # upcoming gameweeks projected
+FORM_ROUNDS = 6 # rounds of recent form
+FORM_WEIGHT = 0.7 # weight of recent form against the season mean
+STRENGTH_EFFECT = 0.1 # change in points per unit of strength difference
+HOME_EFFECT = 0.05 # change in points at home, and away in reverse
+RECOVERY = 0.5 # share of a player's doubt cleared each gameweek
+LEVELS = ['cost', 'selected'] # stats that are a level, not a match count
+
+class Tensor:
+    """
+    players-df as a dense array of players x rounds x stats with a mask of
+    the rounds each player has a match in. Matches in the same round (double
+    gameweeks) are summed, except for LEVELS such as 'cost', which take the
+    round's highest value.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        players-df DataFrame with at least 'round' and stats, indexed by
+        player id
+    stats : list, optional
+        stat columns to include. Default None (every column after 'round')
+
+    Attributes
+    ----------
+    ids : np.ndarray
+        player ids, sorted, along axis 0
+    rounds : np.ndarray
+        rounds with at least one match, sorted, along axis 1
+    stats : list
+        stat names along axis 2
+    values : np.ndarray
+        float64 array of shape (players, rounds, stats), 0 where masked
+    mask : np.ndarray
+        bool array of shape (players, rounds), True where a player has a
+        match in the round
+    players : pd.DataFrame
+        the non-stat columns (e.g. 'name', 'position') of each player, in
+        the order of ids
+    """
+    def __init__(self, df:pd.DataFrame, stats:list=None):
+        columns = list(df.columns)
+        if stats is None: stats = columns[columns.index('round') + 1:]
+        self.stats = list(stats)
+
+        self.ids, player = np.unique(df.index.to_numpy(), return_inverse=True)
+        self.rounds, round = np.unique(
+            df['round'].to_numpy(), return_inverse=True)
+
+        self.values = np.zeros(
+            (len(self.ids), len(self.rounds), len(self.stats)))
+        level = np.isin(self.stats, LEVELS)
+        values = df[self.stats].to_numpy(dtype='float64')
+        np.add.at(self.values, (player, round), np.where(level, 0, values))
+        if level.any():
+            levels = np.full(self.values.shape[:2] + (level.sum(),), -np.inf)
+            np.maximum.at(levels, (player, round), values[:, level])
+            self.values[:, :, level] = np.where(np.isneginf(levels), 0, levels)
+        self.mask = np.zeros((len(self.ids), len(self.rounds)), dtype=bool)
+        self.mask[player, round] = True
+
+        _, first = np.unique(player, return_index=True)
+        self.players = df.iloc[first][[
+            x for x in ['name', 'team', 'position'] if x in df]]
+
+    def stat(self, name:str) -> np.ndarray:
+        """
+        Returns the (players, rounds) slice of the stat name.
+        """
+        return self.values[:, :, self.stats.index(name)]
+
+
+def derive(tensor:Tensor) -> dict:
+    """
+    Computes every per-player metric for all stats in one pass over the
+    tensor.
+
+    Parameters
+    ----------
+    tensor : Tensor
+        the dataset to analyse
+
+    Returns
+    -------
+    dict
+        'count' (players,) of rounds played; 'latest' (players,) index of
+        each player's latest round; 'sum', 'mean' and 'var' (sample
+        variance, NaN below 2 rounds) of shape (players, stats);
+        'cumulative' and 'form' (mean from the round to the latest) of shape
+        (players, rounds, stats), NaN where masked; and, if 'cost' is a
+        stat, 'cost' (players,) in the latest round and 'value' (players,
+        stats) of sum per cost
+    """
+    values, mask = tensor.values, tensor.mask[:, :, None]
+    count = mask.sum(axis=1)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        total = values.sum(axis=1)
+        mean = total / count
+        var = (((values - mean[:, None, :]) ** 2) * mask).sum(axis=1) / (
+            count - 1)
+        var[count[:, 0] < 2] = np.nan
+
+        cumulative = np.where(mask, values.cumsum(axis=1), np.nan)
+        form = np.where(
+            mask,
+            values[:, ::-1].cumsum(axis=1)[:, ::-1]
+            / mask[:, ::-1].cumsum(axis=1)[:, ::-1],
+            np.nan)
+
+    latest = (
+        mask.shape[1] - 1 - mask[:, ::-1, 0].argmax(axis=1) if mask.size
+        else np.zeros(len(mask), dtype='int64'))
+    metrics = {
+        'count': count[:, 0],
+        'latest': latest,
+        'sum': total,
+        'mean': mean,
+        'var': var,
+        'cumulative': cumulative,
+        'form': form}
+
+    if 'cost' in tensor.stats:
+        cost = tensor.stat('cost')[np.arange(len(latest)), latest]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            metrics['cost'] = cost
+            metrics['value'] = total / cost[:, None]
+
+    return metrics
+
+
+def project(
+    dat:dict,
+    horizon:int=HORIZON,
+    df:pd.DataFrame=None
+) -> pd.DataFrame:
+    """
+    Projects every player's points over the next gameweeks of upcoming
+    fixtures in one player x fixture array operation.
+
+    A player's expected points per match are their mean points per match,
+    weighted towards the last FORM_ROUNDS rounds, scaled by the difference
+    between their team's and the opponent's strength and by home advantage.
+    chance_of_playing_next_round scales the next gameweek, and players are
+    assumed to recover by RECOVERY of the remaining doubt each gameweek
+    after.
+
+    Parameters
+    ----------
+    dat : dict
+        data returned by get_data, with 'upcoming' fixtures
+    horizon : int, optional
+        number of upcoming gameweeks to project. Default 5
+    df : pd.DataFrame, optional
+        players-df to take form from. Default None (dat['players-df'])
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per player per upcoming gameweek, indexed by player id, with
+        'name', 'team', 'position', 'round', 'fixtures' (0 in a blank
+        gameweek, 2 in a double) and 'projected_points'
+    """
+    df = dat['players-df'] if df is None else df
+    players = dat['players']
+    ids = np.array(sorted(players), dtype='int64')
+
+    # Points per match, overall and over recent rounds
+    points = df['total_points'].astype('float64')
+    recent = df['round'].to_numpy() > df['round'].max() - FORM_ROUNDS
+    mean = points.groupby(level=0).mean().reindex(ids).to_numpy()
+    form = points[recent].groupby(level=0).mean().reindex(ids).to_numpy()
+    rate = np.nan_to_num(
+        FORM_WEIGHT * np.where(np.isnan(form), mean, form)
+        + (1 - FORM_WEIGHT) * mean)
+
+    # Upcoming fixtures in the next horizon gameweeks
+    upcoming = dat.get('upcoming', {})
+    rounds = np.unique([x['event'] for x in upcoming.values()])[:horizon]
+    fixtures = [x for x in upcoming.values() if x['event'] in rounds]
+    event, team_h, team_a = (
+        np.array([x[k] for x in fixtures], dtype='int64')
+        for k in ['event', 'team_h', 'team_a'])
+
+    # Players x fixtures
+    team = np.array([players[id]['team'] for id in ids], dtype='int64')
+    strength = np.zeros(
+        max([0, *dat['teams'], *team_h, *team_a]) + 1, dtype='float64')
+    for id, x in dat['teams'].items(): strength[id] = x.get('strength', 0)
+    home = team[:, None] == team_h[None, :]
+    away = team[:, None] == team_a[None, :]
+    opponent = strength[np.where(home, team_a[None, :], team_h[None, :])]
+    multiplier = np.clip(
+        1 + STRENGTH_EFFECT * (strength[team][:, None] - opponent)
+        + HOME_EFFECT * np.where(home, 1, -1),
+        0, None)
+
+    chance = np.array(
+        [players[id].get('chance_of_playing_next_round') for id in ids],
+        dtype='float64')
+    doubt = 1 - np.nan_to_num(chance, nan=100) / 100
+    gameweek = np.searchsorted(rounds, event)
+    available = 1 - doubt[:, None] * RECOVERY ** gameweek[None, :]
+
+    expected = rate[:, None] * multiplier * available * (home | away)
+
+    # Sum fixtures into gameweeks
+    gameweeks = np.zeros((len(fixtures), len(rounds)))
+    gameweeks[np.arange(len(fixtures)), gameweek] = 1
+    teams = {k: v['name'] for k, v in dat['teams'].items()}
+    positions = {k: v['name'] for k, v in dat['positions'].items()}
+    return pd.DataFrame(
+        {
+            'name': np.repeat(
+                [players[id]['name'] for id in ids], len(rounds)),
+            'team': np.repeat(
+                [teams.get(players[id]['team']) for id in ids], len(rounds)),
+            'position': np.repeat(
+                [positions.get(players[id]['position']) for id in ids],
+                len(rounds)),
+            'round': np.tile(rounds, len(ids)),
+            'fixtures': ((home | away) @ gameweeks).astype('int64').ravel(),
+            'projected_points': (expected @ gameweeks).ravel()},
+        index=pd.Index(np.repeat(ids, len(rounds))))
@@ -1,26 +1,100 @@
+from concurrent.futures import ThreadPoolExecutor
 from dash import Dash, dcc, html
 from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
+from flask import Response, abort, jsonify, request
+from functools import lru_cache
+from itertools import count
+from threading import Event, Lock, Thread
+from time import sleep
+from uuid import uuid4
 
-import altair as alt
 import dash_bootstrap_components as dbc
-import pickle
+import hashlib
+import hmac
+import json
+import metrics
+import os
+import plotly.io.json
 
-from plots import plots
+## pandas, numpy and altair (via dataset and plots) are imported on first
+## use, in the background loader, so the app starts without them
 
 
-alt.data_transformers.disable_max_rows()
+# Declare constants
+DATA_PATH = './data' # dataset.DATA_PATH
+META = 'meta.json' # dataset.META
+CACHE_SIZE = int(os.environ.get('CHART_CACHE_SIZE', 128))
+DIMS_BUCKET = 50 # px
+PREWARM_DIMS = {'height': 350, 'width-pts': 300, 'width-lns': 1400}
+RELOAD_INTERVAL = float(os.environ.get('DATA_RELOAD_INTERVAL', 60)) # s
+LOAD_TIMEOUT = 60 # s
+RENDER_WORKERS = int(os.environ.get('RENDER_WORKERS', 2))
+MAX_SESSIONS = 10_000
+COST_RANGE = (35, 150) # cost filter bounds, in the API's units of 0.1m
+MINUTES_RANGE = (0, 38 * 90) # total minutes filter bounds
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+DATA_FORMAT = 2 # version of /data's json records, cached as immutable
+
+
+def read_meta() -> dict:
+    """
+    Reads the dataset summary the layout is built from (see
+    dataset.summarize), or None if there is no dataset.
+    """
+    try:
+        with open(os.path.join(DATA_PATH, META)) as f: return json.load(f)
+    except (OSError, ValueError):
+        return None
+
 
 # Load data
-try:
-    with open('./data.pkl', 'rb') as f: dat = pickle.load(f)
-    stats = [
-        stat for stat in
-        list(list(dat['players'].values())[0]['matches'].values())[0].keys()
-    ]
-except:
-    data_loaded = False
-else:
-    data_loaded = True
+## meta is read up front so the layout can be served straight away, while
+## the dataset loads in the background; handlers that need it wait on
+## loaded. data is the current dataset. datasets also keeps the previous
+## version so renders and data requests already in flight during a reload
+## finish against the version they started with.
+meta = read_meta()
+data, datasets = None, {}
+loaded = Event()
+reload_lock = Lock()
+
+## plotly's default orjson engine, which serves the layout, checks every
+## value orjson cannot encode (such as components) against numpy and pandas
+## whenever they are in sys.modules, and so fails while the loader is part
+## way through importing them. The json engine encodes components through
+## their to_plotly_json first, so the layout never touches either module.
+plotly.io.json.config.default_engine = 'json'
+
+
+def load_data():
+    """
+    Imports the data modules and opens the dataset, then sets loaded.
+    """
+    global data, datasets, meta
+    try:
+        import dataset
+        import plots # imported here to take its import time off first render
+
+        data = dataset.Dataset(DATA_PATH)
+        datasets = {data.version: data}
+        if meta is None or meta['version'] != data.version:
+            meta = dataset.summarize(data.manifest)
+    except Exception as e:
+        print(f'dataset load failed: {e!r}')
+    finally:
+        loaded.set()
+
+    if data is not None and os.environ.get('CHART_CACHE_PREWARM'): prewarm()
+
+
+def wait_loaded():
+    """
+    Blocks until the background load finishes. Returns the current dataset,
+    or None if there is none.
+    """
+    loaded.wait(LOAD_TIMEOUT)
+    return data
 
 # Declare dash app
 app = Dash(
@@ -32,92 +106,522 @@ app = Dash(
 
 server = app.server
 
+
+# Chart cache
+@lru_cache(maxsize=CACHE_SIZE)
+def render_chart(
+    version:str,
+    stat:str,
+    agg:str,
+    pos:str,
+    players:tuple,
+    height:int,
+    width_pts:int,
+    width_lns:int
+) -> str:
+    """
+    Renders the chart HTML. Results are cached on all arguments, so version
+    (the dataset version) keeps a new dataset from hitting stale entries.
+    Without players, the chart loads every player's data from /data; with
+    players (ids from filter_players), it embeds only theirs.
+    """
+    from plots import COLUMNS, plots
+
+    dims = {'height': height, 'width-pts': width_pts, 'width-lns': width_lns}
+    with metrics.stage('chart_spec'):
+        if players is None:
+            chart = plots(
+                df=datasets.get(version, data).load(
+                    columns=['name', 'round', stat]),
+                dims=dims,
+                stat=stat,
+                aggregate=agg,
+                pos=pos,
+                data_url=app.get_relative_path(
+                    f'/data/{version}/{stat}.json?format={DATA_FORMAT}'))
+        else:
+            df = datasets.get(version, data).load(
+                columns=list(dict.fromkeys(COLUMNS + [stat])))
+            chart = plots(
+                df=df[df.index.isin(players)],
+                dims=dims,
+                stat=stat,
+                aggregate=agg,
+                pos=pos,
+                preaggregate=True)
+    with metrics.stage('chart_html'):
+        html = chart.to_html()
+    metrics.observe('chart_payload_bytes', len(html.encode()))
+    return html
+
+
+@lru_cache(maxsize=32)
+def render_data(version:str, stat:str) -> bytes:
+    """
+    Serialises the per-player chart data for stat as json records.
+    """
+    from plots import COLUMNS, player_totals
+
+    return player_totals(
+        datasets.get(version, data).load(
+            columns=list(dict.fromkeys(COLUMNS + [stat]))),
+        stat
+    ).to_json(orient='records').encode()
+
+
+@lru_cache(maxsize=64)
+def export_size(version:str, format:str, filters:tuple) -> int:
+    """
+    Counts the bytes of an export, encoding it without keeping it.
+    """
+    import export
+
+    return sum(map(len, export.stream(
+        datasets.get(version, data), format, **dict(filters))))
+
+
+@lru_cache(maxsize=2)
+def player_index(version:str):
+    """
+    Builds the search index over the players of a dataset version.
+    """
+    from search import PlayerIndex
+
+    return PlayerIndex(datasets.get(version, data).load(
+        columns=['name', 'team', 'position', 'round', 'cost', 'minutes']))
+
+
+def filter_players(
+    version:str,
+    text:str=None,
+    teams:list=None,
+    pos:str=None,
+    cost:list=None,
+    minutes:list=None
+) -> tuple:
+    """
+    Applies the sidebar's player filters. Ranges covering COST_RANGE or
+    MINUTES_RANGE do not filter. Returns the sorted ids of the matching
+    players, or None if no filter is set.
+    """
+    cost, minutes = (
+        None if value is None or (
+            value[0] <= bounds[0] and value[1] >= bounds[1])
+        else tuple(value)
+        for value, bounds in [(cost, COST_RANGE), (minutes, MINUTES_RANGE)])
+    if not (text or teams or cost or minutes): return None
+
+    with metrics.stage('player_search'):
+        ids = player_index(version).query(
+            text, teams, [pos] if pos else None, cost, minutes)
+    return tuple(sorted(ids.tolist()))
+
+
+@lru_cache(maxsize=32)
+def render_squad(version:str, stat:str) -> tuple:
+    """
+    Picks the squad with the highest season total of stat. Returns its rows
+    as records.
+    """
+    import squad
+
+    with metrics.stage('squad'):
+        picked = squad.optimize(squad.candidates(
+            datasets.get(version, data).load(columns=list(dict.fromkeys(
+                ['name', 'team', 'position', 'round', 'cost', stat]))),
+            stat))
+    return tuple(picked.to_dict('records'))
+
+
+def bucket(dims:dict) -> tuple:
+    """
+    Rounds chart dimensions to DIMS_BUCKET so similar viewports share cache
+    entries. Returns (height, width-pts, width-lns).
+    """
+    return tuple(
+        max(DIMS_BUCKET, DIMS_BUCKET * round(dims[k] / DIMS_BUCKET))
+        for k in ['height', 'width-pts', 'width-lns'])
+
+
+def prewarm(stat:str='total_points', dims:dict=PREWARM_DIMS):
+    """
+    Renders every aggregate and position combination of stat into the cache.
+    """
+    current = data
+    for agg in ['weekly', 'cumulative', 'form']:
+        for pos in [
+            None,
+            *(p['name'] for p in current.manifest['positions'].values())
+        ]:
+            render_chart(
+                current.version, stat, agg, pos, None, *bucket(dims))
+
+
+# Render queue
+## Chart renders run on a small pool so concurrent users cannot occupy every
+## server thread with CPU-bound work. Each session's requests are numbered
+## and only its latest one is wanted: a render is skipped if every session
+## waiting on it has moved on by the time it starts, and a finished render
+## is discarded if its session has moved on. Requests for the same chart
+## share one render.
+renders = ThreadPoolExecutor(RENDER_WORKERS, thread_name_prefix='render')
+sequence = count()
+latest = {} # {session: number of its latest request}
+inflight = {} # {render_chart args: (future, {(session, number)})}
+render_lock = Lock()
+
+
+def request_render(session:str, args:tuple) -> str:
+    """
+    Queues render_chart(*args) as session's latest request and waits for
+    it. Returns the chart HTML, or None if the request was superseded.
+    """
+    with render_lock:
+        number = next(sequence)
+        latest.pop(session, None)
+        latest[session] = number
+        if len(latest) > MAX_SESSIONS: del latest[next(iter(latest))]
+
+        if args in inflight:
+            future, waiters = inflight[args]
+            metrics.observe('renders', 1, outcome='coalesced')
+        else:
+            future, waiters = renders.submit(_render, args), set()
+            inflight[args] = (future, waiters)
+        waiters.add((session, number))
+
+    html = future.result()
+    if html is None or latest.get(session) != number:
+        metrics.observe('renders', 1, outcome='stale')
+        return None
+    return html
+
+
+def _render(args:tuple) -> str:
+    with render_lock:
+        _, waiters = inflight[args]
+        if all(latest.get(session) != n for session, n in waiters):
+            del inflight[args]
+            metrics.observe('renders', 1, outcome='skipped')
+            return None
+    try:
+        html = render_chart(*args)
+        metrics.observe('renders', 1, outcome='rendered')
+        return html
+    finally:
+        with render_lock: del inflight[args]
+
+
+def start_renders():
+    global renders
+    renders = ThreadPoolExecutor(RENDER_WORKERS, thread_name_prefix='render')
+
+
+def reload_data() -> bool:
+    """
+    Opens the dataset on disk and, if it is a new version, swaps it in and
+    drops the render caches tied to the old version. Returns whether the
+    dataset changed.
+    """
+    import dataset
+
+    global data, datasets, meta
+    wait_loaded()
+    with reload_lock:
+        new = dataset.Dataset(DATA_PATH)
+        if data is not None and new.version == data.version: return False
+
+        datasets = {
+            new.version: new,
+            **({} if data is None else {data.version: data})}
+        data = new
+        meta = dataset.summarize(new.manifest)
+        render_chart.cache_clear()
+        render_data.cache_clear()
+        render_squad.cache_clear()
+        player_index.cache_clear()
+        export_size.cache_clear()
+
+    print(f'loaded dataset version {new.version}')
+    if os.environ.get('CHART_CACHE_PREWARM'): prewarm()
+    return True
+
+
+def watch_data():
+    """
+    Polls the dataset manifest every RELOAD_INTERVAL seconds and reloads the
+    dataset when it is replaced. A failed reload is retried at the next poll.
+    """
+    path = os.path.join(DATA_PATH, 'manifest.json')
+    mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else None
+    while True:
+        sleep(RELOAD_INTERVAL)
+        try:
+            current = os.stat(path).st_mtime_ns
+            if current != mtime:
+                reload_data()
+                mtime = current
+        except Exception as e:
+            print(f'dataset reload failed: {e!r}')
+
+
+@server.route('/cache')
+def cache_info():
+    return jsonify(render_chart.cache_info()._asdict())
+
+
+@server.route('/metrics')
+def metrics_endpoint():
+    info = render_chart.cache_info()
+    metrics.gauge('chart_cache_hits', info.hits)
+    metrics.gauge('chart_cache_misses', info.misses)
+    body = metrics.registry.render(pid=os.getpid())
+    if os.path.exists(metrics.METRICS_PATH):
+        with open(metrics.METRICS_PATH) as f: body += f.read()
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+
+@server.route('/data/<version>/<stat>.json')
+def chart_data(version:str, stat:str):
+    wait_loaded()
+    if version not in datasets or stat not in datasets[version].stats:
+        abort(404)
+    response = Response(
+        render_data(version, stat),
+        mimetype='application/json')
+    response.set_etag(f'{version}-{stat}-{DATA_FORMAT}')
+    response.cache_control.public = True
+    response.cache_control.max_age = 365 * 24 * 60 * 60
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
+
+
+## Streams players-df as /export.csv or /export.arrow, filtered by the
+## comma separated query parameters stats, rounds, positions and teams. The
+## ETag covers the dataset version and the query, and a single byte range
+## is served by encoding the export up to the end of the range.
+@server.route('/export.<format>')
+def export_data(format:str):
+    import export
+
+    current = wait_loaded()
+    if current is None or format not in export.FORMATS: abort(404)
+    if format == 'arrow' and export.pyarrow is None: abort(501)
+    filters = {
+        key: (
+            tuple(x for x in request.args[key].split(',') if x)
+            if request.args.get(key) else None)
+        for key in ['stats', 'rounds', 'positions', 'teams']}
+    try:
+        if filters['rounds']:
+            filters['rounds'] = tuple(int(x) for x in filters['rounds'])
+        export.columns(current, filters['stats'])
+    except (KeyError, ValueError):
+        abort(400)
+
+    key = (current.version, format, tuple(filters.items()))
+    etag = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    headers = {'Accept-Ranges': 'bytes', 'Cache-Control': 'no-cache'}
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    parts = export.stream(current, format, **filters)
+    status = 200
+    if (
+        request.range is not None and len(request.range.ranges) == 1
+        and request.if_range.date is None
+        and request.if_range.etag in (None, etag)
+    ):
+        total = export_size(*key)
+        bounds = request.range.range_for_length(total)
+        if bounds is None:
+            return Response(
+                status=416,
+                headers={**headers, 'Content-Range': f'bytes */{total}'})
+        start, stop = bounds
+        parts = export.byte_range(parts, start, stop)
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{stop - 1}/{total}'
+        headers['Content-Length'] = str(stop - start)
+
+    response = Response(
+        parts, status=status, mimetype=export.FORMATS[format],
+        headers=headers)
+    response.set_etag(etag)
+    return response
+
+
+@server.route('/admin/reload', methods=['POST'])
+def admin_reload():
+    if ADMIN_TOKEN is None: abort(404)
+    if not hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(),
+        f'Bearer {ADMIN_TOKEN}'.encode()
+    ):
+        abort(403)
+    return jsonify(reloaded=reload_data(), version=data.version)
+
+
+Thread(target=load_data, daemon=True).start()
+
+def start_watcher():
+    if RELOAD_INTERVAL > 0: Thread(target=watch_data, daemon=True).start()
+
+
+## threads do not survive fork, so pre-fork servers (gunicorn with
+## preload_app) need a watcher started in each worker
+start_watcher()
+os.register_at_fork(after_in_child=start_watcher)
+os.register_at_fork(after_in_child=start_renders)
+
 # Dashboard Layout
-app.layout = dbc.Container(
-    children=[
-        dcc.Location(id='url'),
-        dcc.Store(id='viewport-dims'),
-        dbc.Row(
-            children=[
-                dbc.Col(
-                    children=[
-                        dcc.Dropdown(
-                            id='select-stat',
-                            value='total_points',
-                            clearable=False,
-                            options=[
-                                {
-                                    'value': stat,
-                                    'label': ' '.join(
-                                        s.capitalize()
-                                        for s in stat.split('_'))
-                                } for stat in stats]),
-                        html.P(
-                            children='Stat',
-                            className='text-primary'),
-                        dcc.Dropdown(
-                            id='select-agg',
-                            value='weekly',
-                            clearable=False,
-                            searchable=False,
-                            options=[
-                                {'value': 'weekly', 'label': 'Weekly Values'},
-                                {'value': 'cumulative', 'label': 'Cumulative'},
-                                {'value': 'form', 'label': 'Form'}]),
-                        html.P(
-                            children='Bottom Chart Type',
-                            className='text-primary'),
-                        dcc.Dropdown(
-                            id='select-pos',
-                            searchable=False,
-                            placeholder='None',
-                            options=[
-                                {
-                                    'value': pos['name'],
-                                    'label': pos['name']
-                                } for pos in dat['positions'].values()]),
-                        html.P(
-                            children='Position Focus',
-                            className='text-primary'),
-                        html.Hr(
-                            className='text-primary'),
-                        html.P(
-                            children='''
-                                Click on a player in the top charts to view
-                                that player's stats by matchday in the bottom
-                                chart. Hold shift to select multiple players.
-                                ''',
-                            className='text-primary')],
-                    id='sidebar',
-                    class_name='bg-info',
-                    style={
-                        'height': 'inherit',
-                        'padding': '1rem'},
-                    width=2),
-                dbc.Col(
-                    children=html.Iframe(
-                        id='chart',
+def layout():
+    if meta is None: wait_loaded()
+    current = meta
+    return dbc.Container(
+        children=[
+            dcc.Location(id='url'),
+            dcc.Store(id='viewport-dims'),
+            dcc.Store(id='session-id', data=uuid4().hex),
+            dbc.Row(
+                children=[
+                    dbc.Col(
+                        children=[
+                            dcc.Dropdown(
+                                id='select-stat',
+                                value='total_points',
+                                clearable=False,
+                                options=[
+                                    {
+                                        'value': stat,
+                                        'label': ' '.join(
+                                            s.capitalize()
+                                            for s in stat.split('_'))
+                                    } for stat in current['stats']]),
+                            html.P(
+                                children='Stat',
+                                className='text-primary'),
+                            dcc.Dropdown(
+                                id='select-agg',
+                                value='weekly',
+                                clearable=False,
+                                searchable=False,
+                                options=[
+                                    {
+                                        'value': 'weekly',
+                                        'label': 'Weekly Values'},
+                                    {
+                                        'value': 'cumulative',
+                                        'label': 'Cumulative'},
+                                    {'value': 'form', 'label': 'Form'}]),
+                            html.P(
+                                children='Bottom Chart Type',
+                                className='text-primary'),
+                            dcc.Dropdown(
+                                id='select-pos',
+                                searchable=False,
+                                placeholder='None',
+                                options=[
+                                    {'value': pos, 'label': pos}
+                                    for pos in current['positions']]),
+                            html.P(
+                                children='Position Focus',
+                                className='text-primary'),
+                            dcc.Input(
+                                id='search',
+                                type='search',
+                                debounce=True,
+                                placeholder='Name',
+                                style={'width': '100%'}),
+                            html.P(
+                                children='Player Search',
+                                className='text-primary'),
+                            dcc.Dropdown(
+                                id='select-team',
+                                multi=True,
+                                placeholder='All',
+                                options=[
+                                    {'value': team, 'label': team}
+                                    for team in current.get('teams', [])]),
+                            html.P(
+                                children='Teams',
+                                className='text-primary'),
+                            dcc.RangeSlider(
+                                id='select-cost',
+                                min=COST_RANGE[0],
+                                max=COST_RANGE[1],
+                                step=5,
+                                marks={
+                                    x: f'{x / 10:g}m'
+                                    for x in range(50, COST_RANGE[1] + 1, 50)
+                                },
+                                value=list(COST_RANGE)),
+                            html.P(
+                                children='Cost',
+                                className='text-primary'),
+                            dcc.RangeSlider(
+                                id='select-minutes',
+                                min=MINUTES_RANGE[0],
+                                max=MINUTES_RANGE[1],
+                                step=90,
+                                marks={
+                                    x: str(x)
+                                    for x in range(*MINUTES_RANGE, 1000)
+                                },
+                                value=list(MINUTES_RANGE)),
+                            html.P(
+                                children='Minutes',
+                                className='text-primary'),
+                            html.Hr(
+                                className='text-primary'),
+                            html.P(
+                                children='''
+                                    Click on a player in the top charts to
+                                    view that player's stats by matchday in
+                                    the bottom chart. Hold shift to select
+                                    multiple players.
+                                    ''',
+                                className='text-primary'),
+                            html.Hr(
+                                className='text-primary'),
+                            html.Div(
+                                id='squad',
+                                className='text-primary')],
+                        id='sidebar',
+                        class_name='bg-info',
                         style={
-                            'border-width': 0,
-                            'width': '95%',
-                            'height': '95%',
-                            'margin': 0,
-                            'padding': 0}),
-                    id='main',
-                    style={
-                        'height': 'inherit',
-                        'padding': 0})],
-            style={
-                'height': 'inherit',
-                'margin': 0})
-    ] if data_loaded else 'Error. Data not found.',
-    style={
-        'width': '100vw',
-        'height': '100vh',
-        'padding': 0,
-        'margin': 0},
-    fluid=True
-)
+                            'height': 'inherit',
+                            'padding': '1rem'},
+                        width=2),
+                    dbc.Col(
+                        children=html.Iframe(
+                            id='chart',
+                            style={
+                                'border-width': 0,
+                                'width': '95%',
+                                'height': '95%',
+                                'margin': 0,
+                                'padding': 0}),
+                        id='main',
+                        style={
+                            'height': 'inherit',
+                            'padding': 0})],
+                style={
+                    'height': 'inherit',
+                    'margin': 0})
+        ] if current is not None else 'Error. Data not found.',
+        style={
+            'width': '100vw',
+            'height': '100vh',
+            'padding': 0,
+            'margin': 0},
+        fluid=True
+    )
+
+
+app.layout = layout
 
 
 # Callback functions
@@ -144,16 +648,46 @@ app.clientside_callback(
     Input('select-stat', 'value'),
     Input('select-agg', 'value'),
     Input('select-pos', 'value'),
-    State('viewport-dims', 'data')
+    Input('search', 'value'),
+    Input('select-team', 'value'),
+    Input('select-cost', 'value'),
+    Input('select-minutes', 'value'),
+    State('viewport-dims', 'data'),
+    State('session-id', 'data')
+)
+def update_chart(
+    _, stat, agg, pos, text, teams, cost, minutes, dims, session
+):
+    if dims is None or wait_loaded() is None: raise PreventUpdate
+    with metrics.stage('update_chart'):
+        version = data.version
+        players = filter_players(version, text, teams, pos, cost, minutes)
+        if players == ():
+            return '<p style="color: lightgrey">No players match.</p>'
+        html = request_render(
+            session, (version, stat, agg, pos, players, *bucket(dims)))
+    if html is None: raise PreventUpdate
+    return html
+
+
+@app.callback(
+    Output('squad', 'children'),
+    Input('select-stat', 'value')
 )
-def update_chart(_, stat, agg, pos, dims):
-    return plots(
-        df=dat['players-df'],
-        dims=dims,
-        stat=stat,
-        aggregate=agg,
-        pos=pos
-    ).to_html()
+def update_squad(stat):
+    if wait_loaded() is None: raise PreventUpdate
+    try:
+        players = render_squad(data.version, stat)
+    except ValueError:
+        return 'No squad fits the budget.'
+    cost = sum(x['cost'] for x in players) / 10
+    return [
+        html.P(children=f'Best Squad ({cost:.1f}m)'),
+        *(
+            html.P(
+                children=f'{x["name"]} ({x["cost"] / 10:.1f}m)',
+                style={'margin': 0, 'opacity': 1 if x['starting'] else 0.6})
+            for x in players)]
 
 
 # Run app
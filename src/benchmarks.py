@@ -0,0 +1,679 @@
+"""
+Benchmarks for the data pipeline.
+
+Usage: python benchmarks.py [players_df] [load] [workers] [pipeline] [history]
+                            [startup] [fixtures] [projections] [squad]
+                            [search] [export]
+                            [--players 600] [--rounds 38] [--seasons 1]
+                            [--output benchmarks.json] [--baseline FILE]
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from io import StringIO
+from requests import get
+from tempfile import TemporaryDirectory
+from time import perf_counter, sleep
+
+from analytics import project
+from get_data import (
+    ENDPOINTS, MATCH_STATS, _get_data, join_fixtures, players_df)
+from make_html import make_html
+from plots import plots
+from stub_api import make_seasons
+
+import dataset
+import export
+import history
+import json
+import os
+import pandas as pd
+import pickle
+import platform
+import random
+import search
+import squad
+import subprocess
+import sys
+import tracemalloc
+
+
+# Declare constants
+SUITES = [
+    'players_df', 'load', 'workers', 'pipeline', 'history', 'startup',
+    'fixtures', 'projections', 'squad', 'search', 'export']
+STARTUP_TARGET = 0.75 # s from interpreter start to a served layout
+PROJECTION_TARGET = 1.0 # s to project the full player pool
+SQUAD_TARGET = 0.25 # s to pick a squad from the full player pool
+REGRESSION = 1.2 # slowdown over the baseline reported as a regression
+
+
+def make_dat(players:int, rounds:int=38, seed:int=0) -> tuple:
+    """
+    Generates a synthetic dataset shaped like the output of get_data, with
+    'teams', 'positions' and 'players', and the players' matches.
+    """
+    rng = random.Random(seed)
+    dat = {
+        'teams': {i: {'name': f'Team {i}'} for i in range(1, 21)},
+        'positions': {
+            i: {'name': name} for i, name in enumerate([
+                'Goalkeeper', 'Defender', 'Midfielder', 'Forward'], 1)},
+        'players': {
+            id: {
+                'name': f'Player {id}',
+                'team': rng.randint(1, 20),
+                'position': rng.randint(1, 4)}
+            for id in range(1, players + 1)}}
+    matches = {
+        id: [
+            {'round': round, **{
+                stat: rng.randint(0, 90) for stat in MATCH_STATS}}
+            for round in range(1, rounds + 1)]
+        for id in dat['players']}
+    return dat, matches
+
+
+def legacy_players_df(dat:dict, matches:dict) -> pd.DataFrame:
+    """
+    The per-player pd.concat expansion players_df replaced, kept for
+    comparison. Only builds the columns it had: 'name', 'team', 'position',
+    'round' and the match stats.
+    """
+    df = pd.DataFrame(
+        {id: {**dat['players'][id], 'matches': x} for id, x in matches.items()}
+    ).T[['name', 'team', 'position', 'matches']]
+    df['team'] = df['team'].map(
+        {k: v['name'] for k, v in dat['teams'].items()})
+    df['position'] = df['position'].map(
+        {k: v['name'] for k, v in dat['positions'].items()})
+    df['matches'] = pd.Series(
+        data=[
+            pd.DataFrame(x).rename(columns={'value': 'cost'})
+            for x in df['matches']],
+        index=df.index,
+        dtype=object)
+    for idx, matches in df.pop('matches').items():
+        matches.index = [idx for _ in matches.index]
+        matches[['name', 'team', 'position']] = df.loc[
+            idx,
+            ['name', 'team', 'position']]
+        df = pd.concat([df.drop(index=idx), matches])
+    df.loc[:, 'round':] = df.loc[:, 'round':].astype('int64')
+    return df
+
+
+def bench_players_df(
+    sizes:tuple=(600, 6_000, 60_000),
+    legacy_limit:int=6_000
+):
+    """
+    Times players_df against the legacy expansion at each number of
+    player-seasons. The legacy build is skipped above legacy_limit.
+    """
+    print(f'{"players":>8} {"rows":>10} {"legacy (s)":>11} {"bulk (s)":>9}')
+    for size in sizes:
+        dat, matches = make_dat(size)
+
+        start = perf_counter()
+        df = players_df(dat, matches)
+        bulk = perf_counter() - start
+
+        legacy = float('nan')
+        if size <= legacy_limit:
+            start = perf_counter()
+            expected = legacy_players_df(dat, matches)
+            legacy = perf_counter() - start
+            pd.testing.assert_frame_equal(df[expected.columns], expected)
+
+        print(f'{size:>8} {len(df):>10} {legacy:>11.2f} {bulk:>9.2f}')
+
+
+def _measure(code:str) -> dict:
+    """
+    Runs code in a fresh interpreter and returns its wall time and the peak
+    RSS it added over importing pandas and the dataset module.
+    """
+    script = f"""
+import json, re, time
+import pandas as pd, pickle, dataset
+hwm = lambda: int(re.search(
+    r'VmHWM:\\s+(\\d+)', open('/proc/self/status').read()).group(1))
+rss = hwm()
+start = time.perf_counter()
+{code}
+print(json.dumps({{
+    'seconds': time.perf_counter() - start,
+    'rss_mb': (hwm() - rss) / 1024
+}}))
+"""
+    return json.loads(subprocess.run(
+        [sys.executable, '-c', script],
+        capture_output=True, check=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    ).stdout)
+
+
+def bench_load(sizes:tuple=(600, 6_000)):
+    """
+    Compares load time and peak RSS of a data.pkl holding both the nested
+    players dict and players-df against the columnar dataset, loading all
+    columns and only the columns the charts need.
+    """
+    columns = ['name', 'position', 'round', 'total_points', 'minutes', 'cost']
+    print(f'{"players":>8} {"format":<20} {"load (s)":>9} {"rss (MB)":>9}')
+    for size in sizes:
+        dat, matches = make_dat(size)
+        dat['players-df'] = players_df(dat, matches)
+        with TemporaryDirectory() as tmp:
+            pkl = os.path.join(tmp, 'data.pkl')
+            path = os.path.join(tmp, 'data')
+            with open(pkl, 'wb') as f:
+                pickle.dump({
+                    **dat,
+                    'players': {
+                        id: {**player, 'matches': matches[id]}
+                        for id, player in dat['players'].items()}
+                }, f)
+            dataset.save(dat, path)
+
+            for name, code in {
+                'pickle': f'pickle.load(open({pkl!r}, "rb"))',
+                'dataset': f'dataset.load_dat({path!r})',
+                'dataset (6 columns)':
+                    f'dataset.load({path!r}, columns={columns!r})'
+            }.items():
+                result = _measure(code)
+                print(
+                    f'{size:>8} {name:<20} {result["seconds"]:>9.3f} '
+                    f'{result["rss_mb"]:>9.1f}')
+
+
+def _memory(pid:int) -> dict:
+    """
+    Reads a process's resident and proportional set sizes in MB. PSS splits
+    shared pages between the processes mapping them.
+    """
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        fields = dict(line.split(':', 1) for line in f if ':' in line)
+    return {
+        k: int(fields[k].split()[0]) / 1024 for k in ['Rss', 'Pss']}
+
+
+def bench_workers(workers:tuple=(1, 4, 8), port:int=8051, requests:int=200):
+    """
+    Serves the app with gunicorn.conf.py at each worker count, requests the
+    chart data for every stat from all workers, then reports the RSS and PSS
+    of the master and the mean per worker.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    url = f'http://127.0.0.1:{port}'
+    print(
+        f'{"workers":>8} {"master rss":>11} {"worker rss":>11} '
+        f'{"worker pss":>11} {"total pss":>10}')
+    for n in workers:
+        server = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                '-w', str(n), '-b', f'127.0.0.1:{port}'],
+            cwd=root,
+            env={**os.environ, 'DATA_RELOAD_INTERVAL': '0'},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            for _ in range(100):
+                try:
+                    get(f'{url}/_dash-layout')
+                    break
+                except Exception:
+                    sleep(0.2)
+
+            data = dataset.Dataset(os.path.join(root, 'data'))
+            version, stats = data.version, data.stats
+            with ThreadPoolExecutor(max_workers=2 * n) as pool:
+                list(pool.map(
+                    lambda i: get(
+                        f'{url}/data/{version}/{stats[i % len(stats)]}.json'),
+                    range(requests)))
+
+            children = [
+                int(pid) for pid in os.listdir('/proc') if pid.isdigit()
+                and open(f'/proc/{pid}/stat').read().split()[3]
+                == str(server.pid)]
+            master = _memory(server.pid)
+            usage = [_memory(pid) for pid in children]
+            rss = sum(x['Rss'] for x in usage) / len(usage)
+            pss = sum(x['Pss'] for x in usage) / len(usage)
+            total = master['Pss'] + sum(x['Pss'] for x in usage)
+            print(
+                f'{n:>8} {master["Rss"]:>11.1f} {rss:>11.1f} {pss:>11.1f} '
+                f'{total:>10.1f}')
+        finally:
+            server.terminate()
+            server.wait()
+
+
+class ReplayClient:
+    """
+    Stands in for client.Client, serving stub_api payloads from memory so
+    the get_data transform can be timed without any HTTP.
+    """
+    def __init__(self, payloads:dict):
+        self.payloads = payloads
+        self.prefix = ENDPOINTS['general'][:-len('bootstrap-static/')]
+
+    def get(self, url:str):
+        return self.payloads[url[len(self.prefix):]]
+
+    def get_many(self, urls:dict, callback=None) -> dict:
+        results = {key: self.get(url) for key, url in urls.items()}
+        if callback is not None:
+            for key, result in results.items(): callback(key, result)
+        return results
+
+
+def _profile(function, *args, repeat:int=3) -> tuple:
+    """
+    Calls function with args repeat times, then once more under
+    tracemalloc. Returns its result, the best wall time in seconds and the
+    peak memory allocated during the call in MB.
+    """
+    seconds = float('inf')
+    for _ in range(repeat):
+        start = perf_counter()
+        function(*args)
+        seconds = min(seconds, perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, seconds, peak / 2 ** 20
+
+
+def bench_pipeline(
+    players:int=600,
+    rounds:int=38,
+    seasons:int=1,
+    repeat:int=3
+) -> list:
+    """
+    Times and measures the peak memory of each stage of the pipeline on
+    synthetic payloads: the get_data transform, spec construction in
+    plots.plots, to_html serialization and make_html, which renders the
+    page and rewrites it with BeautifulSoup.
+
+    Parameters
+    ----------
+    players : int, optional
+        players per season. Default 600
+    rounds : int, optional
+        rounds per season. Default 38
+    seasons : int, optional
+        seasons generated and transformed, concatenated for the later
+        stages. Default 1
+    repeat : int, optional
+        timed calls per stage, the best of which is reported. Default 3
+
+    Returns
+    -------
+    list
+        one {'stage', 'players', 'rounds', 'seasons', 'rows', 'seconds',
+        'peak_mb'} record per stage
+    """
+    results, rows = [], players * rounds * seasons
+
+    def record(stage, function, *args):
+        result, seconds, peak = _profile(function, *args, repeat=repeat)
+        results.append({
+            'stage': stage, 'players': players, 'rounds': rounds,
+            'seasons': seasons, 'rows': rows, 'seconds': seconds,
+            'peak_mb': peak})
+        print(f'{stage:<10} {rows:>10} {seconds:>9.3f} {peak:>9.1f}')
+        return result
+
+    def transform(payloads):
+        with redirect_stdout(StringIO()):
+            return [_get_data(ReplayClient(x))['players-df'] for x in payloads]
+
+    payloads = make_seasons(seasons, players=players, rounds=rounds)
+    print(f'{"stage":<10} {"rows":>10} {"time (s)":>9} {"peak (MB)":>9}')
+    df = dataset.apply_schema(pd.concat(
+        record('transform', transform, payloads)))
+    chart = record('plots', plots, df)
+    record('to_html', chart.to_html)
+    record('make_html', make_html, df)
+
+    return results
+
+
+def bench_history(players:int=600, rounds:int=38, seasons:int=10):
+    """
+    Builds a history store of synthetic seasons and times queries across
+    all seasons, one season and a few columns, and the season totals.
+    """
+    with TemporaryDirectory() as path:
+        for payloads in make_seasons(seasons, players=players, rounds=rounds):
+            with redirect_stdout(StringIO()):
+                history.append(_get_data(ReplayClient(payloads)), path=path)
+        last = history.list_seasons(path)[-1]
+
+        print(f'{"query":<28} {"rows":>10} {"time (s)":>9}')
+        for name, query in {
+            'all seasons, all columns':
+                lambda: history.load(path=path),
+            'all seasons, 3 columns':
+                lambda: history.load(
+                    columns=['code', 'round', 'total_points'], path=path),
+            'one season, 3 columns':
+                lambda: history.load(
+                    [last], ['code', 'round', 'total_points'], path=path),
+            'season totals': lambda: history.totals(path=path)
+        }.items():
+            start = perf_counter()
+            df = query()
+            print(f'{name:<28} {len(df):>10} {perf_counter() - start:>9.3f}')
+
+
+def legacy_join_fixtures(
+    df:pd.DataFrame,
+    dat:dict,
+    payloads:dict
+) -> pd.DataFrame:
+    """
+    Joins fixtures to players-df with a Python lookup per row of the
+    'opponent_team' and 'was_home' the API gives for the match in the
+    player's element-summary, for comparison with join_fixtures. Rows must
+    have fixture ids.
+    """
+    teams = {k: v['name'] for k, v in dat['teams'].items()}
+    matches = {}
+    for id in set(df.index):
+        for match in payloads[f'element-summary/{id}/']['history']:
+            matches[id, match['fixture']] = match
+    columns = {'opponent': [], 'was_home': [], 'opponent_strength': []}
+    for id, fixture in zip(df.index, df['fixture']):
+        match = matches[id, fixture]
+        opponent = match['opponent_team']
+        columns['opponent'].append(teams[opponent])
+        columns['was_home'].append(match['was_home'])
+        columns['opponent_strength'].append(
+            dat['teams'][opponent]['strength'])
+    return df.assign(**columns)
+
+
+def bench_fixtures(players:int=600, rounds:int=38, seasons:int=10):
+    """
+    Times join_fixtures against a per-row Python lookup of the API's own
+    opponent and side on every season of a synthetic multi-season history,
+    with double and blank gameweeks and players who moved club, and checks
+    that they agree.
+    """
+    seasons = make_seasons(seasons, players=players, rounds=rounds)
+    dats = []
+    for payloads in seasons:
+        with redirect_stdout(StringIO()):
+            dats.append(_get_data(ReplayClient(payloads), checkpoint=None))
+
+    print(f'{"join":<8} {"rows":>10} {"time (s)":>9}')
+    results = {}
+    for name, join in {
+        'legacy': legacy_join_fixtures,
+        'bulk': lambda df, dat, payloads: join_fixtures(df, dat)
+    }.items():
+        start = perf_counter()
+        results[name] = [
+            join(dat['players-df'], dat, payloads)
+            for dat, payloads in zip(dats, seasons)]
+        rows = sum(len(x) for x in results[name])
+        print(f'{name:<8} {rows:>10} {perf_counter() - start:>9.3f}')
+
+    for legacy, bulk in zip(results['legacy'], results['bulk']):
+        for column in ['opponent', 'was_home', 'opponent_strength']:
+            assert (
+                legacy[column].to_numpy() == bulk[column].to_numpy()).all()
+
+
+def bench_projections(
+    sizes:tuple=(700, 7_000),
+    horizons:tuple=(1, 5, 10),
+    repeat:int=3
+) -> bool:
+    """
+    Times analytics.project over each number of players and upcoming
+    gameweeks. Returns whether every run met PROJECTION_TARGET.
+    """
+    print(f'{"players":>8} {"horizon":>8} {"rows":>8} {"time (s)":>9}')
+    passed = True
+    for size in sizes:
+        payloads = make_seasons(players=size, upcoming=max(horizons))[0]
+        with redirect_stdout(StringIO()):
+            dat = _get_data(ReplayClient(payloads), checkpoint=None)
+        for horizon in horizons:
+            df, seconds, _ = _profile(project, dat, horizon, repeat=repeat)
+            passed &= seconds <= PROJECTION_TARGET
+            print(f'{size:>8} {horizon:>8} {len(df):>8} {seconds:>9.3f}')
+    print(
+        f'projections {"met" if passed else "missed"} the '
+        f'{PROJECTION_TARGET}s target')
+    return passed
+
+
+def bench_squad(
+    sizes:tuple=(700, 7_000),
+    stats:tuple=('total_points', 'bps', 'minutes'),
+    repeat:int=3
+) -> bool:
+    """
+    Times summarising players-df and optimizing a squad for each number of
+    players and stat, plus projected points, and checks every squad against
+    the rules. Returns whether every run met SQUAD_TARGET.
+    """
+    print(
+        f'{"players":>8} {"score":<18} {"time (s)":>9} {"cost":>6} '
+        f'{"total":>9}')
+    passed = True
+    for size in sizes:
+        with redirect_stdout(StringIO()):
+            dat = _get_data(
+                ReplayClient(make_seasons(players=size)[0]), checkpoint=None)
+        scores = {stat: (stat, None) for stat in stats}
+        scores['projected_points'] = ('total_points', project(dat))
+        for name, (stat, projected) in scores.items():
+            picked, seconds, _ = _profile(
+                lambda: squad.optimize(squad.candidates(
+                    dat['players-df'], stat, projected)),
+                repeat=repeat)
+            assert picked['cost'].sum() <= squad.BUDGET
+            assert picked['team'].value_counts().max() <= squad.TEAM_LIMIT
+            assert picked['position'].value_counts().to_dict() == squad.QUOTAS
+            assert picked['starting'].sum() == squad.STARTERS
+            passed &= seconds <= SQUAD_TARGET
+            print(
+                f'{size:>8} {name:<18} {seconds:>9.3f} '
+                f'{picked["cost"].sum():>6} {picked["score"].sum():>9.1f}')
+    print(f'squads {"met" if passed else "missed"} the {SQUAD_TARGET}s target')
+    return passed
+
+
+def bench_search(players:int=700, seasons:int=10, repeat:int=100):
+    """
+    Builds the player search index over a pool the size of seasons of
+    players and times typical sidebar queries.
+    """
+    dat, matches = make_dat(players * seasons)
+    df = players_df(dat, matches)
+
+    start = perf_counter()
+    index = search.PlayerIndex(df)
+    print(
+        f'index of {len(index.ids)} players built in '
+        f'{perf_counter() - start:.3f}s')
+
+    print(f'{"query":<24} {"players":>8} {"time (ms)":>10}')
+    for name, kwargs in {
+        'prefix': {'text': 'player 12'},
+        'fuzzy': {'text': 'plyaer 1234'},
+        'team': {'teams': ['Team 1', 'Team 2']},
+        'position and cost': {'positions': ['Forward'], 'cost': (0, 45)},
+        'minutes': {'minutes': (1_500, 3_000)},
+        'all filters': {
+            'text': 'player 1', 'teams': ['Team 1'],
+            'positions': ['Defender'], 'cost': (0, 60),
+            'minutes': (0, 2_000)}
+    }.items():
+        start = perf_counter()
+        for _ in range(repeat): ids = index.query(**kwargs)
+        seconds = (perf_counter() - start) / repeat
+        print(f'{name:<24} {len(ids):>8} {seconds * 1000:>10.2f}')
+
+
+def bench_export(sizes:tuple=(700, 7_000)):
+    """
+    Streams datasets of each number of players through every available
+    export format and reports the time, output size and peak memory, next
+    to the peak memory of loading the whole dataset.
+    """
+    formats = [x for x in export.FORMATS if x != 'arrow' or export.pyarrow]
+    print(
+        f'{"players":>8} {"rows":>9} {"format":<7} {"time (s)":>9} '
+        f'{"size (MB)":>10} {"peak (MB)":>10}')
+    with TemporaryDirectory() as path:
+        for size in sizes:
+            dat, matches = make_dat(size)
+            dat['players-df'] = dataset.apply_schema(players_df(dat, matches))
+            dataset.save(dat, path)
+            data = dataset.Dataset(path)
+            rows = data.manifest['rows']
+
+            _, seconds, peak = _profile(data.load, repeat=1)
+            print(
+                f'{size:>8} {rows:>9} {"load":<7} {seconds:>9.3f} '
+                f'{"":>10} {peak:>10.1f}')
+            for format in formats:
+                size_mb, seconds, peak = _profile(
+                    lambda: sum(map(len, export.stream(data, format)))
+                    / 2 ** 20,
+                    repeat=1)
+                print(
+                    f'{size:>8} {rows:>9} {format:<7} {seconds:>9.3f} '
+                    f'{size_mb:>10.1f} {peak:>10.1f}')
+            del data
+
+
+def bench_startup(runs:int=5) -> bool:
+    """
+    Starts the app in fresh interpreters and reports the best time to
+    import it, to build and encode the layout as it is served and to finish
+    loading the dataset, all from interpreter start. Returns whether the
+    layout met STARTUP_TARGET.
+    """
+    script = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.serve_layout()
+layout = time.perf_counter()
+app.wait_loaded()
+print(json.dumps({
+    'import': imported - start,
+    'layout': layout - start,
+    'loaded': time.perf_counter() - start}))
+"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = [
+        json.loads(subprocess.run(
+            [sys.executable, '-c', script],
+            capture_output=True, check=True, text=True, cwd=root,
+            env={
+                **os.environ,
+                'PYTHONPATH': os.path.join(root, 'src'),
+                'DATA_RELOAD_INTERVAL': '0'}
+        ).stdout.splitlines()[-1])
+        for _ in range(runs)]
+    best = {k: min(x[k] for x in results) for k in results[0]}
+
+    print(f'{"stage":<8} {"time (s)":>9}')
+    for k, v in best.items(): print(f'{k:<8} {v:>9.3f}')
+    passed = best['layout'] <= STARTUP_TARGET
+    print(
+        f'layout {"met" if passed else "missed"} the {STARTUP_TARGET}s '
+        'target')
+    return passed
+
+
+def compare(results:list, baseline:list) -> list:
+    """
+    Prints each result's time and peak memory relative to the matching
+    baseline record and returns the records more than REGRESSION times
+    slower.
+    """
+    key = lambda x: tuple(
+        x[k] for k in ['stage', 'players', 'rounds', 'seasons'])
+    baseline = {key(x): x for x in baseline}
+    regressions = []
+    print(f'{"stage":<10} {"time":>8} {"memory":>8}')
+    for result in results:
+        base = baseline.get(key(result))
+        if base is None: continue
+        time = result['seconds'] / base['seconds']
+        memory = result['peak_mb'] / max(base['peak_mb'], 1e-9)
+        print(f'{result["stage"]:<10} {time:>7.2f}x {memory:>7.2f}x')
+        if time > REGRESSION: regressions.append(result)
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark the data pipeline.')
+    parser.add_argument(
+        'suites', nargs='*', choices=SUITES, default=SUITES,
+        help='benchmarks to run. Default all')
+    parser.add_argument(
+        '--players', type=int, default=600,
+        help='players per season in the pipeline benchmark')
+    parser.add_argument(
+        '--rounds', type=int, default=38,
+        help='rounds per season in the pipeline benchmark')
+    parser.add_argument(
+        '--seasons', type=int, default=1,
+        help='seasons in the pipeline benchmark')
+    parser.add_argument(
+        '--output', default='benchmarks.json',
+        help='file to write the pipeline results to')
+    parser.add_argument(
+        '--baseline',
+        help='pipeline results to compare against; exits 1 on regression')
+    args = parser.parse_args()
+
+    if 'players_df' in args.suites: bench_players_df()
+    if 'load' in args.suites: bench_load()
+    if 'workers' in args.suites: bench_workers()
+    if 'history' in args.suites: bench_history()
+    if 'startup' in args.suites: bench_startup()
+    if 'fixtures' in args.suites: bench_fixtures()
+    if 'projections' in args.suites: bench_projections()
+    if 'squad' in args.suites: bench_squad()
+    if 'search' in args.suites: bench_search()
+    if 'export' in args.suites: bench_export()
+    if 'pipeline' in args.suites:
+        results = bench_pipeline(args.players, args.rounds, args.seasons)
+        with open(args.output, 'w') as f:
+            json.dump({
+                'created': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'pandas': pd.__version__,
+                'machine': platform.machine(),
+                'results': results
+            }, f, indent=2)
+        print(f'results written to {args.output}')
+
+        if args.baseline:
+            with open(args.baseline) as f:
+                regressions = compare(results, json.load(f)['results'])
+            if regressions:
+                print('regressed: ' + ', '.join(
+                    x['stage'] for x in regressions))
+                sys.exit(1)
@@ -0,0 +1,134 @@
+"""
+Builds every artifact from one copy of the data: the dataset in ./data, the
+current season's partition of the history store in ./history and the static
+page in ./index.html. Artifacts whose inputs are unchanged, by content hash,
+are skipped.
+
+Usage: python build.py [--fetch] [--incremental] [--concurrency 8] [--rate 10]
+                       [--cache] [--offline] [--compact]
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from get_data import CACHE_DIR, get_data
+from make_html import HTML_PATH, write_html
+
+import dataset
+import history
+import metrics
+import os
+
+
+def _timed(function, *args) -> tuple:
+    """
+    Calls function with args and returns its result and the seconds taken.
+    """
+    start = perf_counter()
+    result = function(*args)
+    return result, perf_counter() - start
+
+
+def build(
+    fetch:bool=False,
+    incremental:bool=False,
+    concurrency:int=8,
+    rate:float=10,
+    cache_dir:str=None,
+    offline:bool=False,
+    compact:bool=False
+) -> dict:
+    """
+    Fetches or loads the data once, then writes the dataset and the static
+    page from it in parallel.
+
+    Parameters
+    ----------
+    fetch : bool, optional
+        fetch from the API instead of loading the saved dataset. Default False
+    incremental : bool, optional
+        when fetching, only re-fetch players affected since the saved
+        dataset. Default False
+    concurrency : int, optional
+        maximum number of player requests in flight. Default 8
+    rate : float, optional
+        maximum requests per second sent to the API. Default 10
+    cache_dir : str, optional
+        directory to cache API responses in. Default None (no cache)
+    offline : bool, optional
+        replay responses recorded in cache_dir. Default False
+    compact : bool, optional
+        write a size-optimised page with precompressed copies. Default False
+
+    Returns
+    -------
+    dict
+        {stage: (status, seconds)} for every stage
+    """
+    report = {}
+
+    if fetch:
+        previous = (
+            dataset.load_dat()
+            if incremental and os.path.exists(dataset.DATA_PATH) else None)
+        dat, report['fetch'] = _timed(
+            get_data, concurrency, rate, previous, cache_dir, offline)
+    else:
+        dat, report['load'] = _timed(dataset.load_dat)
+    report = {k: ('done', v) for k, v in report.items()}
+
+    (manifest, arrays), seconds = _timed(dataset.encode, dat)
+    report['encode'] = ('done', seconds)
+
+    # Stages below only depend on the encoded data, so run them in parallel
+    with ThreadPoolExecutor() as pool:
+        stages = {
+            'data': pool.submit(_timed, dataset.write, manifest, arrays),
+            'history': pool.submit(_timed, history.append, dat),
+            'html': pool.submit(
+                _timed, write_html, dat['players-df'], manifest['version'],
+                HTML_PATH, compact)}
+        for name, future in stages.items():
+            written, seconds = future.result()
+            report[name] = ('written' if written else 'unchanged', seconds)
+
+    return report
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Build the data and static page.')
+    parser.add_argument(
+        '--fetch', action='store_true',
+        help='fetch from the API instead of loading the saved dataset')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='only re-fetch players affected since the saved dataset')
+    parser.add_argument(
+        '--concurrency', type=int, default=8,
+        help='maximum number of player requests in flight')
+    parser.add_argument(
+        '--rate', type=float, default=10,
+        help='maximum requests per second')
+    parser.add_argument(
+        '--cache', action='store_true',
+        help=f'cache API responses in {CACHE_DIR}')
+    parser.add_argument(
+        '--offline', action='store_true',
+        help=f'replay API responses recorded in {CACHE_DIR}')
+    parser.add_argument(
+        '--compact', action='store_true',
+        help='write a size-optimised, precompressed page')
+    args = parser.parse_args()
+
+    report = build(
+        args.fetch,
+        args.incremental,
+        args.concurrency,
+        args.rate,
+        CACHE_DIR if args.cache or args.offline else None,
+        args.offline,
+        args.compact)
+    for name, (status, seconds) in report.items():
+        print(f'{name:<8} {status:<10} {seconds:>8.2f}s')
+        metrics.observe('stage_seconds', seconds, stage=f'build_{name}')
+    metrics.registry.write(job='build')
@@ -0,0 +1,221 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from requests import Session
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+from threading import Lock
+from time import monotonic, sleep, time
+
+import hashlib
+import json
+import os
+
+
+# Declare constants
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+
+    Parameters
+    ----------
+    rate : float
+        tokens added per second, i.e. the sustained request rate
+    capacity : int, optional
+        maximum burst size. Default 1 (no bursting)
+    """
+    def __init__(self, rate:float, capacity:int=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = monotonic()
+        self._lock = Lock()
+
+    def acquire(self):
+        """
+        Blocks until a token is available and consumes it.
+        """
+        while True:
+            with self._lock:
+                now = monotonic()
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            sleep(wait)
+
+
+class Client:
+    """
+    Pooled keep-alive HTTP client for the fantasy epl API with rate limiting
+    and retries.
+
+    Parameters
+    ----------
+    concurrency : int, optional
+        maximum number of requests in flight. Default 8
+    rate : float, optional
+        maximum requests per second. Default 10
+    retries : int, optional
+        retries on 429/5xx responses and connection errors. Default 5
+    backoff : float, optional
+        base delay in seconds, doubled after each retry. Default 0.5
+    cache_dir : str, optional
+        directory to store responses in. Stored responses are reused while
+        fresh and revalidated with ETag/Last-Modified once stale. Default
+        None (no cache)
+    ttls : dict, optional
+        {url substring: seconds} a stored response stays fresh for. The
+        first matching entry applies; urls matching none are always
+        revalidated. Default None
+    offline : bool, optional
+        serve every url from cache_dir without touching the network,
+        raising LookupError for urls never recorded. Default False
+    """
+    def __init__(
+        self,
+        concurrency:int=8,
+        rate:float=10,
+        retries:int=5,
+        backoff:float=0.5,
+        cache_dir:str=None,
+        ttls:dict=None,
+        offline:bool=False
+    ):
+        if offline and cache_dir is None:
+            raise ValueError('offline mode needs a cache_dir to replay')
+
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.cache_dir = cache_dir
+        self.ttls = ttls or {}
+        self.offline = offline
+        if cache_dir is not None: os.makedirs(cache_dir, exist_ok=True)
+        self.limiter = TokenBucket(rate, capacity=concurrency)
+        self.session = Session()
+        self.session.mount('http://', HTTPAdapter(
+            pool_connections=1, pool_maxsize=concurrency))
+        self.session.mount('https://', HTTPAdapter(
+            pool_connections=1, pool_maxsize=concurrency))
+        self.requests = 0
+        self.cached = 0
+        self._lock = Lock()
+
+    def get(self, url:str):
+        """
+        Fetches a url and returns the decoded json, retrying with exponential
+        backoff on 429/5xx responses. A Retry-After header takes precedence
+        over the backoff delay. With a cache_dir, fresh stored responses are
+        returned without a request and stale ones are revalidated.
+        """
+        entry = self._read_cache(url)
+        if entry is not None and (
+            self.offline or time() - entry['stored'] < self._ttl(url)
+        ):
+            with self._lock: self.cached += 1
+            return entry['body']
+        if self.offline:
+            raise LookupError(f'no recorded response for {url}')
+
+        headers = {}
+        if entry is not None and entry['etag']:
+            headers['If-None-Match'] = entry['etag']
+        if entry is not None and entry['last_modified']:
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        for attempt in range(self.retries + 1):
+            self.limiter.acquire()
+            with self._lock: self.requests += 1
+            try:
+                r = self.session.get(url, headers=headers, timeout=30)
+            except (ConnectionError, Timeout):
+                if attempt == self.retries: raise
+                sleep(self.backoff * 2 ** attempt)
+                continue
+
+            if r.status_code == 304 and entry is not None:
+                self._write_cache(url, {**entry, 'stored': time()})
+                return entry['body']
+
+            if r.status_code not in RETRY_STATUSES or attempt == self.retries:
+                r.raise_for_status()
+                body = r.json()
+                self._write_cache(url, {
+                    'url': url,
+                    'etag': r.headers.get('ETag'),
+                    'last_modified': r.headers.get('Last-Modified'),
+                    'stored': time(),
+                    'body': body})
+                return body
+
+            retry_after = r.headers.get('Retry-After', '')
+            sleep(
+                float(retry_after) if retry_after.isdigit()
+                else self.backoff * 2 ** attempt)
+
+    def get_many(self, urls:dict, callback=None) -> dict:
+        """
+        Fetches a dict of {key: url} concurrently and returns {key: json}.
+        Prints the total fetch time and request rate.
+
+        callback(key, json), if given, is called from the calling thread as
+        each url completes. If a url fails, requests not yet started are
+        cancelled and the error is raised once those in flight finish.
+        """
+        requests, cached, start = self.requests, self.cached, monotonic()
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {
+                pool.submit(self.get, url): key for key, url in urls.items()}
+            try:
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+                    if callback is not None:
+                        callback(futures[future], results[futures[future]])
+            except BaseException:
+                pool.shutdown(cancel_futures=True)
+                raise
+        results = {key: results[key] for key in urls}
+        elapsed = monotonic() - start
+        requests = self.requests - requests
+        print(
+            f'fetched {len(results)} urls ({requests} requests, '
+            f'{self.cached - cached} from cache) in {elapsed:.1f}s '
+            f'[{requests / max(elapsed, 1e-9):.1f} req/s]')
+        return results
+
+    def _ttl(self, url:str) -> float:
+        return next((v for k, v in self.ttls.items() if k in url), 0)
+
+    def _cache_path(self, url:str) -> str:
+        return os.path.join(
+            self.cache_dir, hashlib.sha1(url.encode()).hexdigest() + '.json')
+
+    def _read_cache(self, url:str) -> dict:
+        if self.cache_dir is None: return None
+        try:
+            with open(self._cache_path(url)) as f: return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _write_cache(self, url:str, entry:dict):
+        if self.cache_dir is None: return
+        path = self._cache_path(url)
+        tmp = f'{path}.{os.getpid()}.{id(entry)}.tmp'
+        with open(tmp, 'w') as f: json.dump(entry, f)
+        os.replace(tmp, path)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
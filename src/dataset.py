@@ -0,0 +1,392 @@
+"""
+Columnar on-disk format for the dataset returned by get_data.
+
+A dataset is a directory holding a manifest.json (schema version, content
+version, row ranges per round, column dtypes, string categories and the
+teams, positions, players, fixtures and events metadata), a small meta.json
+summarising it for the app's startup and one .npy file per players-df
+column. Rows are sorted by round so each round is a
+contiguous row range, and columns are memory-mapped on load so only the
+requested columns and rounds are read from disk.
+
+Usage: python dataset.py [data.pkl] [data]
+migrates a pickle written by an earlier version of get_data.py.
+"""
+from argparse import ArgumentParser
+from time import sleep
+
+import hashlib
+import json
+import numpy as np
+import os
+import pandas as pd
+import pickle
+import shutil
+
+
+# Declare constants
+DATA_PATH = './data'
+META = 'meta.json'
+SCHEMA_VERSION = 1
+CHUNK_ROWS = 10_000 # rows per chunk read by Dataset.chunks
+OPEN_ATTEMPTS = 5 # tries to open a dataset that is being replaced
+OPEN_RETRY_DELAY = 0.1 # s between tries
+METADATA = [
+    'teams', 'positions', 'players', 'fixtures', 'events', 'upcoming']
+SCHEMA = {
+    'name': 'category',
+    'team': 'category',
+    'position': 'category',
+    'fixture': 'int16',
+    'opponent': 'category',
+    'was_home': 'bool',
+    'opponent_strength': 'int8',
+    'round': 'int8',
+    'total_points': 'int8',
+    'minutes': 'int16',
+    'goals_scored': 'int8',
+    'assists': 'int8',
+    'clean_sheets': 'int8',
+    'goals_conceded': 'int8',
+    'own_goals': 'int8',
+    'penalties_saved': 'int8',
+    'penalties_missed': 'int8',
+    'yellow_cards': 'int8',
+    'red_cards': 'int8',
+    'saves': 'int8',
+    'bonus': 'int8',
+    'bps': 'int16',
+    'cost': 'int16',
+    'selected': 'int32'}
+
+
+def apply_schema(df:pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts players-df columns to the compact dtypes in SCHEMA. Columns
+    missing from df, e.g. in datasets from before they were added, are
+    skipped.
+
+    Raises
+    ------
+    OverflowError
+        if a value does not fit in its column's integer dtype
+    """
+    overflow = [
+        column for column, dtype in SCHEMA.items()
+        if column in df and len(df)
+        and dtype not in ['category', 'bool'] and (
+            df[column].min() < np.iinfo(dtype).min
+            or df[column].max() > np.iinfo(dtype).max)]
+    if overflow:
+        raise OverflowError(
+            f'values out of range for {SCHEMA[overflow[0]]} in: '
+            + ', '.join(overflow))
+
+    return df.astype({k: v for k, v in SCHEMA.items() if k in df})
+
+
+def memory_report(df:pd.DataFrame) -> str:
+    """
+    Formats the memory used by each column of df and the total, in bytes.
+    """
+    usage = df.memory_usage(index=True, deep=True)
+    width = max(len(k) for k in map(str, usage.index))
+    return '\n'.join(
+        [f'{k:<{width}} {v:>12,}' for k, v in usage.items()]
+        + [f'{"total":<{width}} {usage.sum():>12,}'])
+
+
+def encode(dat:dict) -> tuple:
+    """
+    Converts a dataset to its on-disk form without writing it.
+
+    Parameters
+    ----------
+    dat : dict
+        data returned by get_data
+
+    Returns
+    -------
+    tuple
+        the manifest, including the content hash as 'version', and a dict of
+        column name to array
+    """
+    df = dat['players-df'].sort_values('round', kind='stable')
+    rounds, starts = np.unique(df['round'].to_numpy(), return_index=True)
+    stops = np.append(starts[1:], len(df))
+
+    manifest = {
+        'schema_version': SCHEMA_VERSION,
+        'rows': len(df),
+        'rounds': {
+            str(round): [int(start), int(stop)]
+            for round, start, stop in zip(rounds, starts, stops)},
+        'columns': {},
+        'categories': {},
+        **{
+            key: {str(k): v for k, v in dat.get(key, {}).items()}
+            for key in METADATA}}
+
+    arrays = {'id': df.index.to_numpy(dtype='int64')}
+    for column, values in df.items():
+        if pd.api.types.is_numeric_dtype(values):
+            values = values.to_numpy()
+        else:
+            codes, categories = pd.factorize(values, sort=True)
+            manifest['categories'][column] = categories.tolist()
+            values = codes.astype('int32')
+        manifest['columns'][column] = str(df[column].dtype)
+        arrays[column] = values
+
+    digest = hashlib.sha1(json.dumps(manifest, sort_keys=True).encode())
+    for column, values in arrays.items():
+        digest.update(column.encode())
+        digest.update(values.tobytes())
+    manifest['version'] = digest.hexdigest()[:12]
+
+    return manifest, arrays
+
+
+def write(manifest:dict, arrays:dict, path:str=DATA_PATH) -> bool:
+    """
+    Writes an encoded dataset to path, replacing any dataset already there,
+    unless the dataset there has the same version. Returns whether the
+    dataset was written.
+    """
+    try:
+        if (
+            read_manifest(path).get('version') == manifest['version']
+            and os.path.exists(os.path.join(path, META))
+        ):
+            return False
+    except (OSError, ValueError):
+        pass
+
+    tmp = f'{path}.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    for column, values in arrays.items():
+        np.save(os.path.join(tmp, f'{column}.npy'), values)
+    with open(os.path.join(tmp, META), 'w') as f:
+        json.dump(summarize(manifest), f)
+    with open(os.path.join(tmp, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f)
+
+    # Swap the new dataset in
+    if os.path.exists(path):
+        shutil.rmtree(f'{path}.old', ignore_errors=True)
+        os.rename(path, f'{path}.old')
+    os.rename(tmp, path)
+    shutil.rmtree(f'{path}.old', ignore_errors=True)
+    return True
+
+
+def save(dat:dict, path:str=DATA_PATH) -> bool:
+    """
+    Writes a dataset to path, replacing any dataset already there unless it
+    is unchanged. Returns whether the dataset was written.
+
+    Parameters
+    ----------
+    dat : dict
+        data returned by get_data
+    path : str, optional
+        dataset directory. Default './data'
+    """
+    return write(*encode(dat), path)
+
+
+def read_manifest(path:str=DATA_PATH) -> dict:
+    """
+    Reads and validates the manifest of the dataset at path.
+    """
+    with open(os.path.join(path, 'manifest.json')) as f:
+        manifest = json.load(f)
+
+    if manifest.get('schema_version') != SCHEMA_VERSION:
+        raise ValueError(
+            f'{path} has schema version {manifest.get("schema_version")}, '
+            f'expected {SCHEMA_VERSION}. Re-run get_data.py or migrate it.')
+
+    return manifest
+
+
+class Dataset:
+    """
+    A dataset opened for reading. Every column file is memory-mapped when the
+    dataset is opened, so reads stay consistent with the opening manifest
+    even if save() later replaces the files on disk. Opening retries while
+    a save() is part way through swapping the dataset in.
+
+    Parameters
+    ----------
+    path : str, optional
+        dataset directory. Default './data'
+    """
+    def __init__(self, path:str=DATA_PATH):
+        for attempt in range(OPEN_ATTEMPTS):
+            ## write() swaps the directory in with two renames, so path can
+            ## briefly be missing
+            try:
+                manifest = read_manifest(path)
+                arrays = {
+                    column: np.load(
+                        os.path.join(path, f'{column}.npy'),
+                        mmap_mode='r')
+                    for column in ['id', *manifest['columns']]}
+                version = read_manifest(path).get('version')
+            except FileNotFoundError:
+                if attempt == OPEN_ATTEMPTS - 1: raise
+            else:
+                if version == manifest.get('version'): break
+            sleep(OPEN_RETRY_DELAY)
+        else:
+            raise RuntimeError(f'{path} kept changing while being opened')
+
+        self.path = path
+        self.manifest = manifest
+        self.version = manifest.get('version')
+        self.stats = stats(manifest)
+        self._arrays = arrays
+
+    def load(self, columns:list=None, rounds:list=None) -> pd.DataFrame:
+        """
+        Loads players-df, or a subset of its columns and rounds.
+
+        Parameters
+        ----------
+        columns : list, optional
+            columns to load. Default None (all columns)
+        rounds : list, optional
+            rounds to load. Default None (all rounds)
+
+        Returns
+        -------
+        pd.DataFrame
+            players-df as returned by get_data, restricted to columns and
+            rounds
+        """
+        manifest = self.manifest
+        rows = slice(None) if rounds is None else np.concatenate([
+            np.arange(*manifest['rounds'][str(round)])
+            for round in rounds if str(round) in manifest['rounds']
+        ] or [np.empty(0, dtype='int64')])
+        return self._frame(columns, rows).sort_index(kind='stable')
+
+    def chunks(
+        self,
+        columns:list=None,
+        rounds:list=None,
+        rows:int=CHUNK_ROWS
+    ):
+        """
+        Reads players-df, or a subset of its columns and rounds, as
+        DataFrames of at most rows rows in round order, so only one chunk is
+        held in memory at a time.
+
+        Parameters
+        ----------
+        columns : list, optional
+            columns to load. Default None (all columns)
+        rounds : list, optional
+            rounds to load. Default None (all rounds)
+        rows : int, optional
+            maximum rows per chunk. Default 10,000
+
+        Yields
+        ------
+        pd.DataFrame
+            consecutive rows of players-df, indexed by player id
+        """
+        ranges = self.manifest['rounds']
+        for round in sorted(
+            int(x) for x in ranges
+            if rounds is None or int(x) in rounds
+        ):
+            start, stop = ranges[str(round)]
+            for x in range(start, stop, rows):
+                yield self._frame(columns, slice(x, min(x + rows, stop)))
+
+    def _frame(self, columns:list, rows) -> pd.DataFrame:
+        manifest = self.manifest
+        columns = list(manifest['columns'] if columns is None else columns)
+
+        data = {}
+        for column in columns:
+            if column in manifest['categories']:
+                data[column] = pd.Categorical.from_codes(
+                    self._arrays[column][rows],
+                    manifest['categories'][column]
+                ).astype(manifest['columns'][column])
+            else:
+                data[column] = np.asarray(self._arrays[column][rows])
+
+        return pd.DataFrame(
+            data,
+            index=pd.Index(np.asarray(self._arrays['id'][rows])))
+
+
+def load(
+    path:str=DATA_PATH,
+    columns:list=None,
+    rounds:list=None
+) -> pd.DataFrame:
+    """
+    Loads players-df, or a subset of its columns and rounds, from the dataset
+    at path. See Dataset.load.
+    """
+    return Dataset(path).load(columns, rounds)
+
+
+def load_dat(path:str=DATA_PATH) -> dict:
+    """
+    Loads a full dataset into a dict shaped like the output of get_data. A
+    path ending in .pkl is read as a pickle written by an earlier version of
+    get_data.py.
+    """
+    if path.endswith('.pkl'):
+        with open(path, 'rb') as f: dat = pickle.load(f)
+        for player in dat['players'].values(): player.pop('matches', None)
+        return dat
+
+    data = Dataset(path)
+    return {
+        **{
+            key: {int(k): v for k, v in data.manifest.get(key, {}).items()}
+            for key in METADATA},
+        'players-df': data.load()}
+
+
+def stats(manifest:dict) -> list:
+    """
+    Lists the match stats in a dataset, i.e. the columns after 'round'.
+    """
+    columns = list(manifest['columns'])
+    return columns[columns.index('round') + 1:]
+
+
+def summarize(manifest:dict) -> dict:
+    """
+    Summarises a dataset for the app's layout: its version, stats, position
+    and team names and latest round. Written to meta.json alongside the
+    manifest.
+    """
+    return {
+        'version': manifest.get('version'),
+        'stats': stats(manifest),
+        'positions': [x['name'] for x in manifest['positions'].values()],
+        'teams': sorted(x['name'] for x in manifest['teams'].values()),
+        'rounds': max(map(int, manifest['rounds']), default=0)}
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Migrate a data.pkl to a dataset.')
+    parser.add_argument('source', nargs='?', default='./data.pkl')
+    parser.add_argument('destination', nargs='?', default=DATA_PATH)
+    args = parser.parse_args()
+
+    dat = load_dat(args.source)
+    dat['players-df'] = apply_schema(dat['players-df'])
+    save(dat, args.destination)
+    print(f'migrated {args.source} to {args.destination}')
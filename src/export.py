@@ -0,0 +1,157 @@
+"""
+Streams players-df from a dataset as CSV or Arrow IPC, a chunk of rows at a
+time, so memory use does not grow with the size of the export.
+
+Arrow IPC needs pyarrow, which is optional.
+"""
+from io import BytesIO
+from itertools import chain
+
+import dataset
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError: # Arrow export unavailable
+    pyarrow = None
+
+
+# Declare constants
+FORMATS = {'csv': 'text/csv', 'arrow': 'application/vnd.apache.arrow.stream'}
+
+
+def columns(data:dataset.Dataset, stats:list=None) -> list:
+    """
+    Lists the columns an export of stats includes: every column up to and
+    including 'round', then stats (default all) in dataset order.
+
+    Raises
+    ------
+    KeyError
+        if a stat is not in the dataset
+    """
+    unknown = set(stats or []) - set(data.stats)
+    if unknown: raise KeyError(', '.join(sorted(unknown)))
+    fixed = list(data.manifest['columns'])
+    return fixed[:fixed.index('round') + 1] + [
+        x for x in data.stats if stats is None or x in stats]
+
+
+def chunks(
+    data:dataset.Dataset,
+    stats:list=None,
+    rounds:list=None,
+    positions:list=None,
+    teams:list=None,
+    rows:int=dataset.CHUNK_ROWS
+):
+    """
+    Reads the filtered rows of players-df in chunks of at most rows rows,
+    with the player id as the first column 'id'.
+
+    Parameters
+    ----------
+    data : dataset.Dataset
+        dataset to export
+    stats : list, optional
+        stats to include. Default None (all)
+    rounds : list, optional
+        rounds to include. Default None (all)
+    positions : list, optional
+        position names to include. Default None (all)
+    teams : list, optional
+        team names to include. Default None (all)
+    rows : int, optional
+        maximum rows read per chunk. Default 10,000
+
+    Yields
+    ------
+    pd.DataFrame
+        consecutive exported rows, at least one (empty) chunk even if no
+        rows match. Filtered chunks may be shorter or empty
+    """
+    selected = columns(data, stats)
+    for df in chain(
+        data.chunks(selected, rounds, rows),
+        [data.load(selected, rounds=[])]
+    ):
+        mask = np.ones(len(df), dtype=bool)
+        if positions: mask &= df['position'].isin(positions).to_numpy()
+        if teams: mask &= df['team'].isin(teams).to_numpy()
+        df = df[mask]
+        df.index.name = 'id'
+        yield df.reset_index()
+
+
+def stream(data:dataset.Dataset, format:str='csv', **filters):
+    """
+    Encodes the chunks of an export as they are read.
+
+    Parameters
+    ----------
+    data : dataset.Dataset
+        dataset to export
+    format : str, optional
+        'csv' or 'arrow' (an Arrow IPC stream of one record batch per
+        chunk). Default 'csv'
+    filters
+        passed to chunks
+
+    Yields
+    ------
+    bytes
+        consecutive parts of the encoded export
+
+    Raises
+    ------
+    ValueError
+        for an unknown format, or 'arrow' without pyarrow installed
+    """
+    if format not in FORMATS:
+        raise ValueError(f'unknown format {format!r}')
+    if format == 'arrow' and pyarrow is None:
+        raise ValueError('arrow export needs pyarrow')
+
+    parts = chunks(data, **filters)
+    first = next(parts)
+    if format == 'csv':
+        yield first.to_csv(index=False).encode()
+        for df in parts:
+            if len(df): yield df.to_csv(index=False, header=False).encode()
+        return
+
+    ## every chunk's categoricals share the dataset's categories, so the
+    ## stream's dictionaries are only written once
+    sink = BytesIO()
+    schema = pyarrow.Schema.from_pandas(first, preserve_index=False)
+    with pyarrow.ipc.new_stream(sink, schema) as writer:
+        for df in chain([first], parts):
+            if not len(df): continue
+            writer.write_batch(pyarrow.RecordBatch.from_pandas(
+                df, schema=schema, preserve_index=False))
+            yield _drain(sink)
+    yield _drain(sink)
+
+
+def _drain(sink:BytesIO) -> bytes:
+    """
+    Returns and clears the bytes written to sink.
+    """
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+def byte_range(parts, start:int, stop:int):
+    """
+    Yields bytes start up to stop of the concatenation of parts, reading
+    no further than stop.
+    """
+    offset = 0
+    for part in parts:
+        end = offset + len(part)
+        if end > start: yield part[max(start - offset, 0):stop - offset]
+        offset = end
+        if offset >= stop: return
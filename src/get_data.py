@@ -1,24 +1,91 @@
-from requests import get
-from time import sleep
+from argparse import ArgumentParser
 
+from client import Client
+
+import dataset
+import metrics
+
+import hashlib
+import json
+import numpy as np
+import os
 import pandas as pd
-import pickle
 
 
 # Declare constants
-__URL = 'https://fantasy.premierleague.com/api/'
+__URL = os.environ.get(
+    'FPL_API_URL', 'https://fantasy.premierleague.com/api/')
 ENDPOINTS = {
     'general': f'{__URL}bootstrap-static/',
     'fixtures': f'{__URL}fixtures/',
     'player': lambda player_id: f'{__URL}element-summary/{player_id}/'
 }
-DATA_PATH = './data.pkl'
+CACHE_DIR = './.cache/api'
+CHECKPOINT_PATH = './.cache/crawl.jsonl'
+CACHE_TTLS = { # seconds a cached response is used without revalidating
+    'bootstrap-static/': 10 * 60,
+    'fixtures/': 10 * 60,
+    'element-summary/': 60 * 60}
+MATCH_STATS = [
+    'total_points', 'minutes', 'goals_scored', 'assists', 'clean_sheets',
+    'goals_conceded', 'own_goals', 'penalties_saved', 'penalties_missed',
+    'yellow_cards', 'red_cards', 'saves', 'bonus', 'bps', 'value', 'selected']
+MATCH_KEYS = ['round', 'fixture', 'was_home'] + MATCH_STATS
+PAST_STATS = ['season_name', 'start_cost', 'end_cost'] + [
+    stat for stat in MATCH_STATS if stat not in ['value', 'selected']]
 
-def get_data() -> dict:
+def get_data(
+    concurrency:int=8,
+    rate:float=10,
+    previous:dict=None,
+    cache_dir:str=None,
+    offline:bool=False,
+    checkpoint:str=CHECKPOINT_PATH
+) -> dict:
     """
     Fetches and formats data from fantasy epl API. Data is returned in a dict.
+
+    Parameters
+    ----------
+    concurrency : int, optional
+        maximum number of player requests in flight. Default 8
+    rate : float, optional
+        maximum requests per second sent to the API. Default 10
+    previous : dict, optional
+        a dataset returned by an earlier call. If given, only players affected
+        by newly finished fixtures or changed gameweeks are re-fetched and
+        merged into it. Default None (full refresh)
+    cache_dir : str, optional
+        directory to cache API responses in, revalidated per CACHE_TTLS.
+        Default None (no cache)
+    offline : bool, optional
+        replay responses recorded in cache_dir without network access.
+        Default False
+    checkpoint : str, optional
+        file each player's history is appended to as it arrives, so a
+        failed crawl resumes where it stopped when re-run against the same
+        gameweek state. Removed once the crawl completes. Default
+        './.cache/crawl.jsonl' (None to disable)
     """
-    r = get(ENDPOINTS['general']).json()
+    with Client(
+        concurrency=concurrency,
+        rate=rate,
+        cache_dir=cache_dir,
+        ttls=CACHE_TTLS,
+        offline=offline
+    ) as client:
+        return _get_data(client, previous, checkpoint)
+
+
+def _get_data(
+    client:Client,
+    previous:dict=None,
+    checkpoint:str=None
+) -> dict:
+    with metrics.stage('bootstrap'):
+        r = client.get(ENDPOINTS['general'])
+    with metrics.stage('fixtures'):
+        fixtures = client.get(ENDPOINTS['fixtures'])
     dat = {
         'teams': {
             team['id']: {
@@ -34,16 +101,21 @@ def get_data() -> dict:
             player['id']: {
                 k: v for k, v in player.items() if k in [
                     'chance_of_playing_next_round',
-                    'chance_of_playing_this_round', 'element_type',
+                    'chance_of_playing_this_round', 'code', 'element_type',
                     'first_name', 'second_name', 'status', 'team', 'web_name',
                     'minutes']}
             for player in r['elements']},
         'fixtures': {
             fixture['id']: {
                 k: v for k, v in fixture.items() if k in [
-                    'finished', 'kickoff_time', 'team_a', 'team_a_score',
-                    'team_h', 'team_h_score']}
-            for fixture in get(ENDPOINTS['fixtures']).json()}}
+                    'event', 'finished', 'kickoff_time', 'team_a',
+                    'team_a_score', 'team_h', 'team_h_score']}
+            for fixture in fixtures},
+        'events': {
+            event['id']: {
+                k: v for k, v in event.items() if k in [
+                    'finished', 'data_checked']}
+            for event in r['events']}}
 
     # Drop unavailable players
     dat['players'] = {
@@ -54,6 +126,12 @@ def get_data() -> dict:
         K: {k: v for k, v in V.items() if k != 'minutes'}
         for K, V in dat['players'].items() if V['minutes'] > 0}
 
+    # Keep scheduled upcoming fixtures apart for projections
+    dat['upcoming'] = {
+        K: {k: v for k, v in V.items() if k in ['event', 'team_a', 'team_h']}
+        for K, V in dat['fixtures'].items()
+        if not V['finished'] and V['event'] is not None}
+
     # Drop unplayed fixtures and drop 'finished' indicator
     dat['fixtures'] = {
         K: {k: v for k, v in V.items() if k != 'finished'}
@@ -75,56 +153,362 @@ def get_data() -> dict:
             player[new] = player.pop(old)
 
     # Collect player match data
-    print('collecting players...')
-    for id, player in dat['players'].items():
-        sleep(0.1)
-        player['matches'] = {
-            match['round']: {
-                k: v for k, v in match.items() if k in [
-                    'total_points', 'minutes', 'goals_scored', 'assists',
-                    'clean_sheets', 'goals_conceded', 'own_goals',
-                    'penalties_saved', 'penalties_missed', 'yellow_cards',
-                    'red_cards', 'saves', 'bonus', 'bps', 'value', 'selected']}
-            for match in get(ENDPOINTS['player'](id)).json()['history']}
-
-    # Construct DataFrame from players
-    dat['players-df'] = pd.DataFrame(dat['players']).T[
-        ['name', 'team', 'position', 'matches']]
-
-    # Convert team and position from index to name
-    dat['players-df']['team'] = dat['players-df']['team'].map(
-        {k: v['name'] for k, v in dat['teams'].items()})
-
-    dat['players-df']['position'] = dat['players-df']['position'].map(
-        {k: v['name'] for k, v in dat['positions'].items()})
-
-    # Convert match data from dict to DataFrame
-    dat['players-df']['matches'] = pd.Series(
-        data=[
-            pd.DataFrame(x).T.reset_index().rename(
-                columns={'index': 'round', 'value': 'cost'})
-            for x in dat['players-df']['matches']],
-        index=dat['players-df'].index)
-
-    # Expand match data
-    for idx, matches in dat['players-df'].pop('matches').items():
-        matches.index = [idx for _ in matches.index]
-        matches[['name', 'team', 'position']] = dat['players-df'].loc[
-            idx,
-            ['name', 'team', 'position']]
-        dat['players-df'] = pd.concat([
-            dat['players-df'].drop(index=idx),
-            matches])
+    fetch = (
+        set(dat['players']) if not _is_compatible(previous, dat)
+        else _changed_players(previous, dat))
+    histories = {} if checkpoint is None else _read_checkpoint(
+        checkpoint, _crawl_key(dat))
+    histories = {k: v for k, v in histories.items() if k in fetch}
+    print(
+        f'collecting {len(fetch)} of {len(dat["players"])} players'
+        + (f' ({len(histories)} from checkpoint)...' if histories else '...'))
+    metrics.gauge('players_fetched', len(fetch) - len(histories))
+    with metrics.stage('players'):
+        urls = {
+            id: ENDPOINTS['player'](id)
+            for id in fetch if id not in histories}
+        if checkpoint is None:
+            histories.update(client.get_many(urls))
+        else:
+            with open(checkpoint, 'a', encoding='utf-8') as f:
+                def save(id, history):
+                    f.write(json.dumps({'id': id, 'history': history}) + '\n')
+                    f.flush()
+                histories.update(client.get_many(urls, save))
+            os.remove(checkpoint)
+    matches = {
+        id: [
+            {k: v for k, v in match.items() if k in MATCH_KEYS}
+            for match in histories[id]['history']]
+        for id in dat['players'] if id in fetch}
+
+    # Keep players' totals from past seasons
+    dat['history-past'] = {
+        id: (
+            [
+                {k: v for k, v in season.items() if k in PAST_STATS}
+                for season in histories[id].get('history_past', [])]
+            if id in fetch
+            else (previous or {}).get('history-past', {}).get(id, []))
+        for id in dat['players']}
+
+    with metrics.stage('dataframe'):
+        # Construct DataFrame from fetched players and join their fixtures
+        dat['players-df'] = join_fixtures(players_df(dat, matches), dat)
+
+        # Merge with unchanged players from previous data
+        if len(fetch) < len(dat['players']):
+            kept = previous['players-df']
+            kept = kept[kept.index.isin(set(dat['players']) - fetch)]
+            dat['players-df'] = pd.concat(
+                [kept, dat['players-df']]).sort_index(kind='stable')
 
     # Convert dtypes
-    dat['players-df'].loc[:, 'round':] = \
-        dat['players-df'].loc[:, 'round':].astype('int64')
+    with metrics.stage('dtypes'):
+        dat['players-df'] = dataset.apply_schema(dat['players-df'])
+    metrics.gauge('dataset_rows', len(dat['players-df']))
+    print(dataset.memory_report(dat['players-df']))
 
     return dat
 
 
+def players_df(dat:dict, matches:dict) -> pd.DataFrame:
+    """
+    Builds the flat per-match DataFrame for the given players in one pass.
+
+    Parameters
+    ----------
+    dat : dict
+        data with 'teams', 'positions' and 'players'
+    matches : dict
+        {player_id: [match]} for the players to include, in row order, where
+        each match is a dict of 'round', the match stats and, optionally,
+        'fixture' and 'was_home'
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per player per match, indexed by player id, with columns
+        'name', 'team', 'position', 'fixture' (-1 where unknown),
+        'was_home' (1, 0 or -1 where unknown), 'round' and the match stats
+        ('value' renamed to 'cost')
+    """
+    ids = list(matches)
+    matches = list(matches.values())
+    counts = [len(x) for x in matches]
+    rows = sum(counts)
+    teams = {k: v['name'] for k, v in dat['teams'].items()}
+    positions = {k: v['name'] for k, v in dat['positions'].items()}
+
+    columns = {
+        'name': np.repeat(
+            np.array([dat['players'][id]['name'] for id in ids], dtype=object),
+            counts),
+        'team': np.repeat(
+            np.array(
+                [teams.get(dat['players'][id]['team']) for id in ids],
+                dtype=object),
+            counts),
+        'position': np.repeat(
+            np.array(
+                [positions.get(dat['players'][id]['position']) for id in ids],
+                dtype=object),
+            counts),
+        'fixture': np.fromiter(
+            (match.get('fixture', -1) for x in matches for match in x),
+            dtype='int64', count=rows),
+        'was_home': np.fromiter(
+            (match.get('was_home', -1) for x in matches for match in x),
+            dtype='int8', count=rows),
+        'round': np.fromiter(
+            (match['round'] for x in matches for match in x),
+            dtype='int64', count=rows)}
+    for stat in MATCH_STATS:
+        columns['cost' if stat == 'value' else stat] = np.fromiter(
+            (match[stat] for x in matches for match in x),
+            dtype='int64', count=rows)
+
+    return pd.DataFrame(
+        columns,
+        index=pd.Index(np.repeat(np.array(ids, dtype='int64'), counts)))
+
+
+def fixture_index(fixtures:dict) -> dict:
+    """
+    Indexes fixtures for vectorized lookups by fixture id and by team and
+    round.
+
+    Parameters
+    ----------
+    fixtures : dict
+        {fixture_id: fixture} with 'event', 'team_h' and 'team_a'
+
+    Returns
+    -------
+    dict
+        'ids' (sorted fixture ids) with the 'event', 'team_h' and 'team_a'
+        of each; and 'keys', the sorted team * 'span' + round keys of teams
+        with exactly one fixture in a round, with 'positions', the position
+        of that fixture in 'ids'. Teams with no fixture in a round (blank
+        gameweeks) or several (double gameweeks) have no key
+    """
+    ids = np.array(sorted(fixtures), dtype='int64')
+    event, team_h, team_a = (
+        np.array(
+            [fixtures[id][k] or 0 for id in ids.tolist()], dtype='int64')
+        for k in ['event', 'team_h', 'team_a'])
+    span = int(event.max(initial=0)) + 1
+
+    keys = np.concatenate([team_h, team_a]) * span + np.tile(event, 2)
+    keys, positions, counts = np.unique(
+        keys, return_index=True, return_counts=True)
+    single = counts == 1
+    return {
+        'ids': ids,
+        'event': event,
+        'team_h': team_h,
+        'team_a': team_a,
+        'span': span,
+        'keys': keys[single],
+        'positions': positions[single] % max(len(ids), 1)}
+
+
+def join_fixtures(df:pd.DataFrame, dat:dict) -> pd.DataFrame:
+    """
+    Adds each match's opponent, venue and opponent strength to players-df
+    with array lookups rather than per-row Python.
+
+    Rows are matched to fixtures by their 'fixture' id, or, where that is
+    missing (-1 or no column), by the player's team and 'round' when the
+    team has exactly one fixture in the round. Rows matched by fixture id
+    keep their own 'was_home' from the API, which stays right for players
+    who have since moved club. Otherwise a player's side is their current
+    team's side in the fixture. Double gameweeks keep one row per fixture
+    and rows of blank gameweeks cannot occur.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        players-df indexed by player id, with 'round' and optionally
+        'fixture' and 'was_home' (bool, or 1, 0 or -1 where unknown)
+    dat : dict
+        data with 'teams', 'players' and 'fixtures'
+
+    Returns
+    -------
+    pd.DataFrame
+        df with 'fixture' (-1 where unmatched), 'opponent' (team name, NaN
+        where unmatched), 'was_home' and 'opponent_strength' (0 where
+        unmatched) before 'round'
+    """
+    index = fixture_index(dat['fixtures'])
+    rows = len(df)
+
+    # Look up rows by fixture id
+    fixture = (
+        df['fixture'].to_numpy(dtype='int64') if 'fixture' in df
+        else np.full(rows, -1, dtype='int64'))
+    position = np.searchsorted(index['ids'], fixture).clip(
+        max=max(len(index['ids']) - 1, 0))
+    found = (
+        index['ids'][position] == fixture if len(index['ids'])
+        else np.zeros(rows, dtype=bool))
+
+    # Fall back to the player's team and round
+    players = dat['players']
+    team = pd.Series(
+        {id: player['team'] for id, player in players.items()},
+        dtype='int64'
+    ).reindex(df.index, fill_value=0).to_numpy()
+    key = team * index['span'] + df['round'].to_numpy(dtype='int64')
+    fallback = np.searchsorted(index['keys'], key).clip(
+        max=max(len(index['keys']) - 1, 0))
+    by_id = found.copy()
+    fallback_found = ~found & (
+        index['keys'][fallback] == key if len(index['keys'])
+        else np.zeros(rows, dtype=bool))
+    position[fallback_found] = index['positions'][fallback[fallback_found]]
+    found |= fallback_found
+
+    # Resolve each row's side and opponent
+    team_h, team_a = index['team_h'][position], index['team_a'][position]
+    given = (
+        df['was_home'].to_numpy(dtype='int8') if 'was_home' in df
+        else np.full(rows, -1, dtype='int8'))
+    was_home = np.where(
+        by_id & (given >= 0), given == 1, team == team_h)
+    opponent = np.where(was_home, team_a, team_h)
+    opponent[~found] = 0
+
+    size = max([0, *dat['teams']]) + 1
+    names = np.full(size, None, dtype=object)
+    strength = np.zeros(size, dtype='int64')
+    for id, team in dat['teams'].items():
+        names[id], strength[id] = team['name'], team.get('strength', 0)
+
+    df = df.drop(
+        columns=['fixture', 'opponent', 'was_home', 'opponent_strength'],
+        errors='ignore')
+    loc = df.columns.get_loc('round')
+    for column, values in reversed({
+        'fixture': np.where(found, index['ids'][position], -1),
+        'opponent': names[opponent],
+        'was_home': was_home & found,
+        'opponent_strength': strength[opponent]
+    }.items()):
+        df.insert(loc, column, values)
+    return df
+
+
+def _crawl_key(dat:dict) -> str:
+    """
+    Hashes the gameweek state a crawl was made against. Checkpointed player
+    histories are only reused by a crawl with the same key.
+    """
+    return hashlib.sha1(json.dumps(
+        {'events': dat['events'], 'fixtures': sorted(dat['fixtures'])},
+        sort_keys=True
+    ).encode()).hexdigest()
+
+
+def _read_checkpoint(path:str, key:str) -> dict:
+    """
+    Reads the player histories checkpointed at path by a crawl with key,
+    truncating a partly written last line. A missing checkpoint, or one from
+    a different crawl, is replaced by an empty one holding key.
+    """
+    histories, valid = {}, 0
+    try:
+        with open(path, 'rb+') as f:
+            if json.loads(f.readline()).get('key') == key:
+                valid = f.tell()
+                for line in f:
+                    try:
+                        if not line.endswith(b'\n'): break
+                        x = json.loads(line)
+                    except ValueError:
+                        break
+                    histories[x['id']] = x['history']
+                    valid += len(line)
+                f.truncate(valid)
+    except (FileNotFoundError, ValueError):
+        pass
+
+    if not valid:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'key': key}) + '\n')
+    return histories
+
+
+def _is_compatible(previous:dict, dat:dict) -> bool:
+    """
+    Checks whether a previous dataset can be refreshed incrementally, i.e. it
+    exists, records gameweek state and fixture ids and is from the current
+    season.
+    """
+    return (
+        previous is not None
+        and bool(previous.get('events'))
+        and 'fixture' in previous.get('players-df', ())
+        and set(previous['fixtures']) <= set(dat['fixtures']))
+
+
+def _changed_players(previous:dict, dat:dict) -> set:
+    """
+    Finds the players whose match data may differ from previous: new players,
+    players whose details changed and players whose teams played in newly
+    finished fixtures or in gameweeks whose state changed.
+    """
+    changed_events = {
+        id for id, event in dat['events'].items()
+        if previous['events'].get(id) != event}
+    teams = {
+        team
+        for id, fixture in dat['fixtures'].items()
+        if id not in previous['fixtures']
+        or fixture['event'] in changed_events
+        for team in (fixture['team_h'], fixture['team_a'])}
+
+    return {
+        id for id, player in dat['players'].items()
+        if player['team'] in teams
+        or id not in previous['players']
+        or any(
+            previous['players'][id][k] != player[k]
+            for k in ['name', 'team', 'position'])}
+
+
 if __name__ == '__main__':
-    with open(DATA_PATH, 'wb') as f:
-        pickle.dump(get_data(), f)
-    
+    parser = ArgumentParser(description='Fetch fantasy epl data.')
+    parser.add_argument(
+        '--concurrency', type=int, default=8,
+        help='maximum number of player requests in flight')
+    parser.add_argument(
+        '--rate', type=float, default=10,
+        help='maximum requests per second')
+    parser.add_argument(
+        '--incremental', action='store_true',
+        help='only re-fetch players affected since the saved data')
+    parser.add_argument(
+        '--cache', action='store_true',
+        help=f'cache API responses in {CACHE_DIR}')
+    parser.add_argument(
+        '--offline', action='store_true',
+        help=f'replay API responses recorded in {CACHE_DIR}')
+    args = parser.parse_args()
+
+    previous = None
+    if args.incremental and os.path.exists(dataset.DATA_PATH):
+        previous = dataset.load_dat()
+
+    dataset.save(get_data(
+        args.concurrency,
+        args.rate,
+        previous,
+        CACHE_DIR if args.cache or args.offline else None,
+        args.offline))
+
+    print(metrics.registry.report())
+    metrics.registry.write(job='get_data')
     print('data saved successfully')
@@ -0,0 +1,253 @@
+"""
+Multi-season history store.
+
+The store is a directory with one dataset (see dataset.py) per season, named
+season=YYYY-YY, each partitioned by round, plus a totals.json holding the
+players' per-season totals from the API's history_past. Appending a season
+only writes that season's partition, and queries only open the partitions and
+columns they ask for.
+
+Players are identified across seasons by their 'code', as player ids are
+reassigned every season.
+
+Usage: python history.py [data] [history]
+appends the dataset at data to the store at history.
+"""
+from analytics import LEVELS
+from argparse import ArgumentParser
+from datetime import datetime
+
+import dataset
+import json
+import numpy as np
+import os
+import pandas as pd
+import re
+
+
+# Declare constants
+HISTORY_PATH = './history'
+TOTALS = 'totals.json'
+PREFIX = 'season='
+SEASON = r'\d{4}-\d{2}' # season name pattern, e.g. '2022-23'
+
+
+def season_name(dat:dict) -> str:
+    """
+    Names the season of a dataset from its earliest finished fixture, e.g.
+    '2022-23'. Seasons start in July or later.
+
+    Raises
+    ------
+    ValueError
+        if no fixture has finished
+    """
+    kickoff = min(
+        datetime.fromisoformat(fixture['kickoff_time'].replace('Z', ''))
+        for fixture in dat['fixtures'].values())
+    year = kickoff.year if kickoff.month >= 7 else kickoff.year - 1
+    return f'{year}-{(year + 1) % 100:02}'
+
+
+def list_seasons(path:str=HISTORY_PATH) -> list:
+    """
+    Lists the seasons with a partition in the store, oldest first. Other
+    entries, such as the .tmp and .old copies a write leaves behind if it is
+    interrupted, are ignored.
+    """
+    if not os.path.isdir(path): return []
+    return sorted(
+        name[len(PREFIX):] for name in os.listdir(path)
+        if re.fullmatch(re.escape(PREFIX) + SEASON, name)
+        and os.path.exists(os.path.join(path, name, 'manifest.json')))
+
+
+def append(dat:dict, season:str=None, path:str=HISTORY_PATH) -> bool:
+    """
+    Writes a dataset to the store as the partition for its season, replacing
+    only that season's partition, and merges its players' past season totals
+    into totals.json. Before the season's first fixture has finished there is
+    nothing to store, and nothing is written.
+
+    Parameters
+    ----------
+    dat : dict
+        data returned by get_data
+    season : str, optional
+        season name. Default None (derived from the fixtures)
+    path : str, optional
+        store directory. Default './history'
+
+    Returns
+    -------
+    bool
+        whether the season's partition was written
+    """
+    if not dat['fixtures']: return False
+    season = season or season_name(dat)
+    os.makedirs(path, exist_ok=True)
+
+    # Add the players' codes so seasons can be joined
+    df = dat['players-df'].copy()
+    df.insert(
+        df.columns.get_loc('round'),
+        'code',
+        pd.Series({
+            id: player.get('code', -1) for id, player in dat['players'].items()
+        }, dtype='int32').reindex(df.index, fill_value=-1).to_numpy())
+    written = dataset.save(
+        {**dat, 'players-df': df},
+        _partition(path, season))
+
+    # Merge past season totals
+    totals = read_totals(path)
+    for id, past in dat.get('history-past', {}).items():
+        code = str(dat['players'].get(id, {}).get('code', -1))
+        for x in past:
+            name = x['season_name'].replace('/', '-')
+            totals.setdefault(name, {})[code] = {
+                k: v for k, v in x.items() if k != 'season_name'}
+    with open(os.path.join(path, f'{TOTALS}.tmp'), 'w') as f:
+        json.dump(totals, f, sort_keys=True)
+    os.replace(
+        os.path.join(path, f'{TOTALS}.tmp'),
+        os.path.join(path, TOTALS))
+
+    return written
+
+
+def load(
+    seasons:list=None,
+    columns:list=None,
+    rounds:list=None,
+    path:str=HISTORY_PATH
+) -> pd.DataFrame:
+    """
+    Loads per-match rows from the store, reading only the requested
+    seasons, columns and rounds.
+
+    Parameters
+    ----------
+    seasons : list, optional
+        seasons to load, e.g. ['2021-22', '2022-23']. Default None (all)
+    columns : list, optional
+        players-df columns, or 'code', to load. Default None (all)
+    rounds : list, optional
+        rounds to load in every season. Default None (all rounds)
+
+    Returns
+    -------
+    pd.DataFrame
+        the rows of every season, with a categorical 'season' column first
+        and indexed by the player ids of each season
+    """
+    seasons = list_seasons(path) if seasons is None else seasons
+    frames = [
+        dataset.Dataset(_partition(path, season)).load(columns, rounds)
+        for season in seasons]
+    if not frames: return pd.DataFrame()
+
+    # Unify categories so the concatenated columns stay categorical
+    for column in frames[0]:
+        if isinstance(frames[0][column].dtype, pd.CategoricalDtype):
+            categories = pd.api.types.union_categoricals(
+                [x[column] for x in frames], sort_categories=True
+            ).categories
+            for x in frames:
+                x[column] = x[column].cat.set_categories(categories)
+
+    df = pd.concat(frames)
+    df.insert(0, 'season', pd.Categorical(
+        np.repeat(seasons, [len(x) for x in frames]),
+        categories=seasons))
+    return df
+
+
+def totals(
+    seasons:list=None,
+    stats:list=None,
+    path:str=HISTORY_PATH
+) -> pd.DataFrame:
+    """
+    Loads per-player season totals. Seasons with a partition are summed from
+    it, other seasons come from the API's history_past.
+
+    Parameters
+    ----------
+    seasons : list, optional
+        seasons to load. Default None (all)
+    stats : list, optional
+        stats to total. Stats a season lacks, and levels such as 'cost' that
+        cannot be summed, are left out. Default None (every summable stat)
+
+    Returns
+    -------
+    pd.DataFrame
+        one row per season and player code, with 'season', 'code',
+        'start_cost', 'end_cost' and the stats
+    """
+    past = read_totals(path)
+    stored = list_seasons(path)
+    seasons = sorted(set(past) | set(stored)) if seasons is None else seasons
+    frames = []
+    for season in seasons:
+        if season in stored:
+            manifest = dataset.read_manifest(_partition(path, season))
+            columns = _summable(
+                stats or dataset.stats(manifest), manifest['columns'])
+            df = load(
+                [season],
+                ['code', 'round', 'cost', *columns],
+                path=path)
+            groups = df.sort_values('round', kind='stable').groupby('code')
+            df = groups[columns].sum()
+            df['start_cost'] = groups['cost'].first()
+            df['end_cost'] = groups['cost'].last()
+        else:
+            df = pd.DataFrame.from_dict(past.get(season, {}), orient='index')
+            df.index = df.index.astype('int64')
+            if stats is not None:
+                df = df[[
+                    x for x in ['start_cost', 'end_cost'] if x in df
+                ] + _summable(stats, df.columns)]
+        df.index.name = 'code'
+        frames.append(df.reset_index().assign(season=season))
+    if not frames: return pd.DataFrame()
+
+    df = pd.concat(frames, ignore_index=True)
+    return df[['season', 'code', 'start_cost', 'end_cost', *(
+        x for x in df if x not in ['season', 'code', 'start_cost', 'end_cost']
+    )]]
+
+
+def _summable(stats:list, columns:list) -> list:
+    """
+    Keeps the stats in columns that can be totalled, i.e. are not LEVELS.
+    """
+    return [x for x in stats if x in columns and x not in LEVELS]
+
+
+def read_totals(path:str=HISTORY_PATH) -> dict:
+    """
+    Reads {season: {code: totals}} from the store's totals.json.
+    """
+    try:
+        with open(os.path.join(path, TOTALS)) as f: return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _partition(path:str, season:str) -> str:
+    return os.path.join(path, f'{PREFIX}{season}')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Append a dataset to the history.')
+    parser.add_argument('source', nargs='?', default=dataset.DATA_PATH)
+    parser.add_argument('destination', nargs='?', default=HISTORY_PATH)
+    args = parser.parse_args()
+
+    dat = dataset.load_dat(args.source)
+    season = season_name(dat)
+    append(dat, season, args.destination)
+    print(f'appended {season} to {args.destination}')
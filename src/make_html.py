@@ -1,203 +1,364 @@
 import altair as alt
+import brotli
+import gzip
+import hashlib
+import inspect
 import json
+import os
+import pandas as pd
 
+from analytics import Tensor, derive
+from argparse import ArgumentParser
 from bs4 import BeautifulSoup
 from dash_bootstrap_components.themes import SLATE
 
-from get_data import get_data
+import dataset
 
 
 # Configure altair
 alt.data_transformers.disable_max_rows()
 
-# Get data
-if False: # if debugging
-    import pickle
-    with open('./data.pkl', 'rb') as f: df = pickle.load(f)['players-df']
-else:
-    df = get_data()['players-df']
-
-# Define the base upon which to build plots
-selector = alt.selection_multi(empty='none', fields=['name', 'position'])
-base = alt.Chart(df).add_selection(selector)
-
-# Define points plot [var(stat) vs sum(stat) facet by position]
-points = base.transform_aggregate(
-    var='variance(total_points)',
-    sum='sum(total_points)',
-    latest='argmax(round)',
-    groupby=['name', 'position']
-).transform_calculate(
-    value='datum.sum / datum.latest.cost'
-).mark_circle(
-).encode(
-    x=alt.X(
-        shorthand='sum:Q',
-        axis=alt.Axis(format=' .2~s'),
-        title='Total Points'),
-    y=alt.Y(
-        shorthand='var:Q',
-        axis=alt.Axis(labels=False, ticks=False),
-        title='Inconsistency'),
-    opacity=alt.condition(
-        predicate=selector,
-        if_true=alt.value(1.0),
-        if_false=alt.Opacity('value:Q', legend=None)),
-    color=alt.condition(
-        predicate=selector,
-        if_true=alt.value('red'),
-        if_false=alt.Color('value:Q', legend=None, sort='descending')),
-    column=alt.Column(
-        shorthand='position:O',
-        sort=['Goalkeeper', 'Defender', 'Midfielder', 'Forward'],
-        title=None),
-    tooltip=[
-        alt.Tooltip(
-            shorthand='name:N',
-            title='Name'),
-        alt.Tooltip(
+# Declare constants
+HTML_PATH = './index.html'
+PAGE_COLUMNS = ['name', 'position', 'round', 'total_points', 'minutes', 'cost']
+LINK_SPEED = 1.6e6 # bit/s, the throughput of Lighthouse's slow 4G profile
+ROWS_JS = (
+    'function rows(d){var o=[];for(var i=0;i<d.n;i++){var r={};'
+    'for(var k in d.columns){var v=d.columns[k][i];'
+    'r[k]=k in d.categories?d.categories[k][v]:v}o.push(r)}return o}')
+
+
+def make_html(df:pd.DataFrame, build:str=None, compact:bool=False) -> str:
+    """
+    Generates the static dashboard page.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        players-df DataFrame from the dataset
+    build : str, optional
+        build hash to record in the page. Default None
+    compact : bool, optional
+        size-optimise the page: embed only PAGE_COLUMNS, as columns with
+        strings replaced by codes into a list of distinct values, which the
+        page expands back to rows, and skip pretty-printing. Default False
+
+    Returns
+    -------
+    str
+        the page HTML
+    """
+    if compact: df = df[PAGE_COLUMNS]
+
+    # Define the base upon which to build plots
+    selector = alt.selection_multi(empty='none', fields=['name', 'position'])
+    base = alt.Chart(df).add_selection(selector)
+
+    # Define points plot [var(stat) vs sum(stat) facet by position]
+    points = base.transform_aggregate(
+        var='variance(total_points)',
+        sum='sum(total_points)',
+        latest='argmax(round)',
+        groupby=['name', 'position']
+    ).transform_calculate(
+        value='datum.sum / datum.latest.cost'
+    ).mark_circle(
+    ).encode(
+        x=alt.X(
             shorthand='sum:Q',
+            axis=alt.Axis(format=' .2~s'),
             title='Total Points'),
-        alt.Tooltip(
+        y=alt.Y(
             shorthand='var:Q',
-            format=' .2~s',
+            axis=alt.Axis(labels=False, ticks=False),
             title='Inconsistency'),
-        alt.Tooltip(
-            shorthand='value:Q',
-            format=' .2~s',
-            title='Value'),
-        alt.Tooltip(
-            shorthand='latest[cost]:Q',
-            title='Cost')]
-)
-
-# Define lines plot [stat vs round for selected players]
-lines = base.mark_line(
-    point=True
-).transform_window(
-    cumulative='sum(total_points)',
-    groupby=['name', 'position']
-).transform_window(
-    form='mean(total_points)',
-    groupby=['name', 'position'],
-    sort=[alt.SortField(field='round', order='descending')]
-).encode(
-    x=alt.X(
-        shorthand='round:Q',
-        axis=alt.Axis(tickMinStep=1),
-        scale=alt.Scale(domain=(1, df['round'].max())),
-        title='Matchday'),
-    y=alt.Y(
-        shorthand="total_points:Q",
-        axis=alt.Axis(format=' .2~s'),
-        scale=alt.Scale(domain=(0, df['total_points'].max())),
-        title='Total Points'),
-    color=alt.Color(
-        shorthand='name:N',
-        title='Name'),
-    tooltip=[
-        alt.Tooltip(
-            shorthand='total_points:Q',
-            format=' .2~s',
+        opacity=alt.condition(
+            predicate=selector,
+            if_true=alt.value(1.0),
+            if_false=alt.Opacity('value:Q', legend=None)),
+        color=alt.condition(
+            predicate=selector,
+            if_true=alt.value('red'),
+            if_false=alt.Color('value:Q', legend=None, sort='descending')),
+        column=alt.Column(
+            shorthand='position:O',
+            sort=['Goalkeeper', 'Defender', 'Midfielder', 'Forward'],
+            title=None),
+        tooltip=[
+            alt.Tooltip(
+                shorthand='name:N',
+                title='Name'),
+            alt.Tooltip(
+                shorthand='sum:Q',
+                title='Total Points'),
+            alt.Tooltip(
+                shorthand='var:Q',
+                format=' .2~s',
+                title='Inconsistency'),
+            alt.Tooltip(
+                shorthand='value:Q',
+                format=' .2~s',
+                title='Value'),
+            alt.Tooltip(
+                shorthand='latest[cost]:Q',
+                title='Cost')]
+    )
+
+    # Define lines plot [stat vs round for selected players]
+    lines = base.mark_line(
+        point=True
+    ).transform_window(
+        cumulative='sum(total_points)',
+        groupby=['name', 'position']
+    ).transform_window(
+        form='mean(total_points)',
+        groupby=['name', 'position'],
+        sort=[alt.SortField(field='round', order='descending')]
+    ).encode(
+        x=alt.X(
+            shorthand='round:Q',
+            axis=alt.Axis(tickMinStep=1),
+            scale=alt.Scale(domain=(1, df['round'].max())),
+            title='Matchday'),
+        y=alt.Y(
+            shorthand="total_points:Q",
+            axis=alt.Axis(format=' .2~s'),
+            scale=alt.Scale(domain=(0, df['total_points'].max())),
             title='Total Points'),
-        alt.Tooltip(
-            shorthand='minutes',
-            title='Minutes')]
-).transform_filter(
-    selector
-)
-
-# Concatenate charts
-charts = alt.vconcat(
-    points,
-    lines
-).configure(
-    background='#FFF0'
-).configure_axis(
-    grid=False,
-    labelColor='lightgrey',
-    titleColor='lightgrey'
-).configure_header(
-    labelColor='lightgrey'
-).configure_view(
-    strokeWidth=0
-).configure_legend(
-    labelColor='lightgrey',
-    titleColor='lightgrey',
-    orient='top-right'
-)
-
-# Get chart HTML and edit
-soup = BeautifulSoup(charts.to_html(), 'html.parser')
-
-## add page title
-soup.html.head.append(soup.new_tag('title'))
-soup.html.head.title.string = 'Fantasy EPL Dashboard'
-
-## add CSS
-soup.html.head.append(soup.new_tag('link', rel='stylesheet', href=SLATE))
-
-## edit chart javascript
-js = json.loads(charts.to_json())
-js_tag = lambda s: f'JS_TAG{"{"}{s}{"}"}JS_TAG'
-st_tag = lambda s: f'ST_TAG{"{"}{s}{"}"}ST_TAG'
-
-### edit chart dimensions to be adaptive
-js['vconcat'][0]['width'] = js_tag('0.215*window.innerWidth')
-js['vconcat'][0]['height'] = js_tag('0.37*window.innerHeight')
-js['vconcat'][1]['width'] = js_tag('0.9*window.innerWidth')
-js['vconcat'][1]['height'] = js_tag('0.37*window.innerHeight')
-
-### get lines y field from dropdown
-js['vconcat'][1]['encoding']['y']['field'] = \
-    js_tag(f'document.getElementById({st_tag("lns-type")}).value')
-js['vconcat'][1]['encoding']['y']['scale']['domain'] = [
-    0,
-    js_tag(f'((document.getElementById({st_tag("lns-type")}).value == '
-        f'{st_tag("cumulative")}) ? '
-        f'{df.groupby("name").sum()["total_points"].max()} : '
-        f'{df["total_points"].max()})')
-]
-
-### convert json to string and remove tags
-js = json.dumps(
-    js
-).replace(
-    '"JS_TAG{',
-    ''
-).replace(
-    '}JS_TAG"',
-    ''
-).replace(
-    'ST_TAG{',
-    '"'
-).replace(
-    '}ST_TAG',
-    '"'
-)
-
-### overwrite javascript in html and move to head
-i = soup.html.body.script.string.find('{"config')
-j = soup.html.body.script.string.find(';')
-soup.html.head.append(soup.new_tag('script'))
-soup.html.head.find_all('script')[-1].string = (
-    'function get_chart() {'
-    + soup.html.body.script.string[:i]
-    + js
-    + soup.html.body.script.string[j:]
-    + '};')
-soup.html.body.script.decompose()
-
-## add dropdown menu and script to update chart
-soup.html.body['onload'] = 'get_chart()'
-soup.html.body.append(
-    soup.new_tag('select', id='lns-type', onchange='get_chart()'))
-for v, s in {
-    'total_points': 'Weekly', 'cumulative': 'Cumulative', 'form': 'Form'
-}.items():
-    soup.html.body.find('select').append(soup.new_tag('option', value=v))
-    soup.html.body.find('select').find_all('option')[-1].string = s
-
-# Write HTML to file
-with open('index.html', 'w', encoding='utf-8') as f:
-    f.write(str(soup.prettify()))
+        color=alt.Color(
+            shorthand='name:N',
+            title='Name'),
+        tooltip=[
+            alt.Tooltip(
+                shorthand='total_points:Q',
+                format=' .2~s',
+                title='Total Points'),
+            alt.Tooltip(
+                shorthand='minutes',
+                title='Minutes')]
+    ).transform_filter(
+        selector
+    )
+
+    # Concatenate charts
+    charts = alt.vconcat(
+        points,
+        lines
+    ).configure(
+        background='#FFF0'
+    ).configure_axis(
+        grid=False,
+        labelColor='lightgrey',
+        titleColor='lightgrey'
+    ).configure_header(
+        labelColor='lightgrey'
+    ).configure_view(
+        strokeWidth=0
+    ).configure_legend(
+        labelColor='lightgrey',
+        titleColor='lightgrey',
+        orient='top-right'
+    )
+
+    # Get chart HTML and edit
+    soup = BeautifulSoup(charts.to_html(), 'html.parser')
+
+    ## add page title
+    soup.html.head.append(soup.new_tag('title'))
+    soup.html.head.title.string = 'Fantasy EPL Dashboard'
+
+    ## add build hash
+    if build is not None:
+        soup.html.head.append(soup.new_tag(
+            'meta', attrs={'name': 'build-hash', 'content': build}))
+
+    ## add CSS
+    soup.html.head.append(soup.new_tag('link', rel='stylesheet', href=SLATE))
+
+    ## edit chart javascript
+    js = json.loads(charts.to_json())
+    js_tag = lambda s: f'JS_TAG{"{"}{s}{"}"}JS_TAG'
+    st_tag = lambda s: f'ST_TAG{"{"}{s}{"}"}ST_TAG'
+
+    ### edit chart dimensions to be adaptive
+    js['vconcat'][0]['width'] = js_tag('0.215*window.innerWidth')
+    js['vconcat'][0]['height'] = js_tag('0.37*window.innerHeight')
+    js['vconcat'][1]['width'] = js_tag('0.9*window.innerWidth')
+    js['vconcat'][1]['height'] = js_tag('0.37*window.innerHeight')
+
+    ### get lines y field from dropdown
+    js['vconcat'][1]['encoding']['y']['field'] = \
+        js_tag(f'document.getElementById({st_tag("lns-type")}).value')
+    cumulative_max = int(
+        derive(Tensor(df, ['total_points']))['sum'].max(initial=0))
+    weekly_max = df['total_points'].to_numpy().max(initial=0)
+    js['vconcat'][1]['encoding']['y']['scale']['domain'] = [
+        0,
+        js_tag(f'((document.getElementById({st_tag("lns-type")}).value == '
+            f'{st_tag("cumulative")}) ? '
+            f'{cumulative_max} : '
+            f'{weekly_max})')
+    ]
+
+    ### embed datasets as columns, expanded to rows by ROWS_JS
+    columnar = {}
+    if compact:
+        for name, records in js['datasets'].items():
+            columnar[name] = to_columns(pd.DataFrame.from_records(records))
+            js['datasets'][name] = js_tag(f'rows(DATA_TAG{name})')
+
+    ### convert json to string and remove tags
+    js = json.dumps(
+        js,
+        separators=(',', ':') if compact else None
+    ).replace(
+        '"JS_TAG{',
+        ''
+    ).replace(
+        '}JS_TAG"',
+        ''
+    ).replace(
+        'ST_TAG{',
+        '"'
+    ).replace(
+        '}ST_TAG',
+        '"'
+    )
+
+    for name, data in columnar.items():
+        js = js.replace(
+            f'DATA_TAG{name}',
+            json.dumps(data, separators=(',', ':')))
+
+    ### overwrite javascript in html and move to head
+    i = soup.html.body.script.string.find('{"config')
+    j = soup.html.body.script.string.find(';')
+    soup.html.head.append(soup.new_tag('script'))
+    soup.html.head.find_all('script')[-1].string = (
+        (ROWS_JS if compact else '')
+        + 'function get_chart() {'
+        + soup.html.body.script.string[:i]
+        + js
+        + soup.html.body.script.string[j:]
+        + '};')
+    soup.html.body.script.decompose()
+
+    ## add dropdown menu and script to update chart
+    soup.html.body['onload'] = 'get_chart()'
+    soup.html.body.append(
+        soup.new_tag('select', id='lns-type', onchange='get_chart()'))
+    for v, s in {
+        'total_points': 'Weekly', 'cumulative': 'Cumulative', 'form': 'Form'
+    }.items():
+        soup.html.body.find('select').append(soup.new_tag('option', value=v))
+        soup.html.body.find('select').find_all('option')[-1].string = s
+
+    return str(soup) if compact else str(soup.prettify())
+
+
+def to_columns(df:pd.DataFrame) -> dict:
+    """
+    Converts a DataFrame to {'n': rows, 'columns': {column: values},
+    'categories': {column: distinct values}}, where the values of string
+    columns are indices into their categories.
+    """
+    columns, categories = {}, {}
+    for column, values in df.items():
+        if pd.api.types.is_numeric_dtype(values):
+            columns[column] = values.tolist()
+        else:
+            codes, uniques = pd.factorize(values)
+            columns[column] = codes.tolist()
+            categories[column] = uniques.tolist()
+    return {'n': len(df), 'columns': columns, 'categories': categories}
+
+
+def compress(path:str) -> dict:
+    """
+    Writes gzip and brotli compressed copies of path next to it, as
+    path.gz and path.br. Returns {path: size in bytes} for all three.
+    """
+    with open(path, 'rb') as f: raw = f.read()
+    sizes = {path: len(raw)}
+    for suffix, data in {
+        '.gz': gzip.compress(raw, compresslevel=9, mtime=0),
+        '.br': brotli.compress(raw, quality=11)
+    }.items():
+        with open(path + suffix, 'wb') as f: f.write(data)
+        sizes[path + suffix] = len(data)
+    return sizes
+
+
+def size_report(sizes:dict) -> str:
+    """
+    Formats file sizes and their transfer time at LINK_SPEED.
+    """
+    width = max(len(k) for k in sizes)
+    return '\n'.join(
+        [f'{"file":<{width}} {"bytes":>12} {"load (s)":>9}']
+        + [
+            f'{k:<{width}} {v:>12,} {8 * v / LINK_SPEED:>9.2f}'
+            for k, v in sizes.items()])
+
+
+def build_hash(version:str, compact:bool=False) -> str:
+    """
+    Hashes the inputs of make_html: the dataset version, the export mode,
+    the source of this module and of analytics, which it renders with, and
+    the altair version and stylesheet the page is built against. index.html
+    records it so unchanged pages can be skipped.
+    """
+    digest = hashlib.sha1(
+        f'{version} {compact} {alt.__version__} {SLATE}'.encode())
+    for path in [__file__, inspect.getfile(derive)]:
+        with open(path, 'rb') as f: digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def built_hash(path:str=HTML_PATH) -> str:
+    """
+    Reads the build hash recorded in an existing page, if any.
+    """
+    try:
+        with open(path, encoding='utf-8') as f:
+            tag = BeautifulSoup(f, 'html.parser').find(
+                'meta', attrs={'name': 'build-hash'})
+    except FileNotFoundError:
+        return None
+    return tag and tag.get('content')
+
+
+def write_html(
+    df:pd.DataFrame,
+    version:str,
+    path:str=HTML_PATH,
+    compact:bool=False
+) -> bool:
+    """
+    Writes the page for df to path unless the page there was already built
+    from the same inputs. Returns whether the page was written. A compact
+    page (see make_html) is also written precompressed to path.gz and
+    path.br, and their sizes are printed.
+    """
+    if built_hash(path) == build_hash(version, compact): return False
+
+    html = make_html(df, build_hash(version, compact), compact)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(html)
+    if compact:
+        print(size_report(compress(path)))
+    else:
+        for suffix in ['.gz', '.br']:
+            if os.path.exists(path + suffix): os.remove(path + suffix)
+    return True
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Write the static dashboard page.')
+    parser.add_argument(
+        '--compact', action='store_true',
+        help='write a size-optimised, precompressed page')
+    args = parser.parse_args()
+
+    data = dataset.Dataset()
+    write_html(data.load(), data.version, compact=args.compact)
@@ -0,0 +1,169 @@
+"""
+Lightweight stage timing and memory instrumentation, rendered in the
+Prometheus text exposition format.
+
+Each process keeps its own registry, so under gunicorn every worker reports
+its own callbacks. Batch jobs (get_data.py, build.py) write their registry to
+METRICS_PATH under PIPELINE_PREFIX, which the app appends to its /metrics
+output.
+"""
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+import os
+
+try:
+    import resource
+except ImportError: # not available on Windows
+    resource = None
+
+
+# Declare constants
+PREFIX = 'fpl_'
+PIPELINE_PREFIX = 'fpl_pipeline_'
+METRICS_PATH = os.environ.get('METRICS_PATH', './metrics.prom')
+HELP = {
+    'stage_seconds': ('summary', 'Wall time spent in each stage.'),
+    'stage_max_seconds': ('gauge', 'Slowest run of each stage.'),
+    'stage_last_seconds': ('gauge', 'Most recent run of each stage.'),
+    'stage_peak_rss_bytes': (
+        'gauge', 'Peak process RSS at the end of the last run of a stage.'),
+    'stage_rss_growth_bytes': (
+        'gauge', 'Increase in peak process RSS during the last run of a '
+        'stage.'),
+    'chart_payload_bytes': ('summary', 'Size of the rendered chart HTML.'),
+    'renders': (
+        'summary', 'Chart render requests by outcome: rendered, coalesced '
+        'with a render in flight, skipped or discarded as stale.'),
+    'chart_cache_hits': ('gauge', 'Chart render cache hits.'),
+    'chart_cache_misses': ('gauge', 'Chart render cache misses.'),
+    'players_fetched': ('gauge', 'Players fetched by the last crawl.'),
+    'dataset_rows': ('gauge', 'Rows in the last built players-df.')}
+
+
+def peak_rss() -> int:
+    """
+    Returns the peak resident set size of this process in bytes, or 0 where
+    it cannot be read.
+    """
+    if resource is None: return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Registry:
+    """
+    Thread-safe store of summaries ({count, sum, max, last}) and gauges,
+    keyed by metric name and labels.
+    """
+    def __init__(self):
+        self._summaries = {}
+        self._gauges = {}
+        self._lock = Lock()
+
+    def observe(self, name:str, value:float, **labels):
+        """
+        Adds an observation to the summary name.
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            count, total, peak, _ = self._summaries.get(key, (0, 0, value, 0))
+            self._summaries[key] = (
+                count + 1, total + value, max(peak, value), value)
+
+    def set(self, name:str, value:float, **labels):
+        """
+        Sets the gauge name.
+        """
+        with self._lock:
+            self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    @contextmanager
+    def stage(self, name:str):
+        """
+        Times the enclosed block as stage name and records how much it raised
+        the process's peak RSS.
+        """
+        rss, start = peak_rss(), perf_counter()
+        try:
+            yield
+        finally:
+            seconds = perf_counter() - start
+            self.observe('stage_seconds', seconds, stage=name)
+            after = peak_rss()
+            self.set('stage_peak_rss_bytes', after, stage=name)
+            self.set('stage_rss_growth_bytes', after - rss, stage=name)
+
+    def samples(self) -> dict:
+        """
+        Flattens the registry to {metric name: [(labels, value)]}.
+        """
+        samples = {}
+        with self._lock:
+            for (name, labels), (count, total, peak, last) in sorted(
+                self._summaries.items()
+            ):
+                samples.setdefault(f'{name}_count', []).append((labels, count))
+                samples.setdefault(f'{name}_sum', []).append((labels, total))
+                if name == 'stage_seconds':
+                    samples.setdefault('stage_max_seconds', []).append(
+                        (labels, peak))
+                    samples.setdefault('stage_last_seconds', []).append(
+                        (labels, last))
+            for (name, labels), value in sorted(self._gauges.items()):
+                samples.setdefault(name, []).append((labels, value))
+        return samples
+
+    def render(self, prefix:str=PREFIX, **labels) -> str:
+        """
+        Renders the registry in the Prometheus text format, prefixing every
+        metric name and adding labels to every sample.
+        """
+        lines, described = [], set()
+        for name, values in self.samples().items():
+            base = next(
+                (k for k in HELP if name in (k, f'{k}_count', f'{k}_sum')),
+                name)
+            if base not in described and base in HELP:
+                kind, text = HELP[base]
+                lines += [
+                    f'# HELP {prefix}{base} {text}',
+                    f'# TYPE {prefix}{base} {kind}']
+                described.add(base)
+            for sample_labels, value in values:
+                label = ','.join(
+                    f'{k}="{v}"'
+                    for k, v in [*labels.items(), *sample_labels])
+                lines.append(
+                    f'{prefix}{name}{{{label}}} {value}' if label
+                    else f'{prefix}{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def report(self) -> str:
+        """
+        Formats the stage timings and peak RSS growth as a table.
+        """
+        samples = self.samples()
+        growth = dict(samples.get('stage_rss_growth_bytes', []))
+        return '\n'.join(
+            [f'{"stage":<12} {"time (s)":>9} {"rss growth (MB)":>16}']
+            + [
+                f'{dict(labels)["stage"]:<12} {seconds:>9.2f} '
+                f'{growth.get(labels, 0) / 2 ** 20:>16.1f}'
+                for labels, seconds in samples.get('stage_last_seconds', [])])
+
+    def write(self, path:str=METRICS_PATH, **labels):
+        """
+        Writes the registry rendered under PIPELINE_PREFIX to path, replacing
+        it atomically.
+        """
+        with open(f'{path}.tmp', 'w') as f:
+            f.write(self.render(PIPELINE_PREFIX, **labels))
+        os.replace(f'{path}.tmp', path)
+
+
+# The process-wide registry
+registry = Registry()
+stage = registry.stage
+observe = registry.observe
+gauge = registry.set
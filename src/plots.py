@@ -1,13 +1,25 @@
+from analytics import Tensor, derive
+
 import altair as alt
+import numpy as np
 import pandas as pd
 
 
+# Configure altair
+alt.data_transformers.disable_max_rows()
+
+# Declare constants
+COLUMNS = ['name', 'position', 'round', 'minutes', 'cost']
+
+
 def plots(
     df:pd.DataFrame,
     dims:dict={'height': 500, 'width-pts': 500, 'width-lns': 500}, # TODO: remove
     stat:str='total_points',
     aggregate:str='weekly',
-    pos:str=None
+    pos:str=None,
+    preaggregate:bool=False,
+    data_url:str=None
 ) -> alt.Chart:
     """
     Generates the main plots.
@@ -15,15 +27,23 @@ def plots(
     Parameters
     ----------
     df : pandas.DataFrame
-        players-df DataFrame from data.pkl
+        players-df DataFrame from the dataset, with at least COLUMNS and stat
     dims : dict, optional
         plot dimensions. must contain keys 'height', 'width-pts' & 'width-lns'
     stat : str, optional
-        a key in dat[player_id][matches] to visualise. Default 'total_points'
+        a stat column in df to visualise. Default 'total_points'
     aggregate : str, optional
         how to aggregate lines plot. Default 'weekly'
     pos : str, optional
         which position to focus on. Default None.
+    preaggregate : bool, optional
+        compute the points plot's per-player aggregates in pandas and embed
+        one row per player, with the lines plot's per-round values as arrays
+        flattened in the browser, instead of every match row. Default False.
+    data_url : str, optional
+        url serving player_totals(df, stat) for all positions as json
+        records. If given, the chart loads its data from there instead of
+        embedding it, and df is only used for the scale domains. Default None.
 
     Returns
     -------
@@ -32,24 +52,37 @@ def plots(
     """
     stat_title = ' '.join(s.capitalize() for s in stat.split('_'))
 
-    # Define the base upon which to build plots
+    # Define the bases upon which to build plots
     selector = alt.selection_multi(empty='none', fields=['name', 'position'])
-    base = alt.Chart(
-        df if pos is None else df[df['position'] == pos]
-    ).add_selection(
+    flattened = list(dict.fromkeys(['round', 'minutes', stat]))
+    if data_url is not None:
+        points = alt.Chart(
+            alt.UrlData(url=data_url, format=alt.DataFormat(type='json')))
+        if pos is not None:
+            points = points.transform_filter(alt.datum.position == pos)
+        lines = points.transform_flatten(flattened)
+    elif preaggregate:
+        points = alt.Chart(player_totals(
+            df if pos is None else df[df['position'] == pos],
+            stat))
+        lines = points.transform_flatten(flattened)
+    else:
+        data = df if pos is None else df[df['position'] == pos]
+        points = alt.Chart(data).transform_aggregate(
+            var=f'variance({stat})',
+            sum=f'sum({stat})',
+            latest='argmax(round)',
+            groupby=['name', 'position']
+        ).transform_calculate(
+            value='datum.sum / datum.latest.cost',
+            latest_cost='datum.latest.cost')
+        lines = alt.Chart(data)
+
+    # Define points plot [var(stat) vs sum(stat) facet by position]
+    points = points.add_selection(
         selector
     ).properties(
         height=dims['height']
-    )
-
-    # Define points plot [var(stat) vs sum(stat) facet by position]
-    points = base.transform_aggregate(
-        var=f'variance({stat})',
-        sum=f'sum({stat})',
-        latest='argmax(round)',
-        groupby=['name', 'position']
-    ).transform_calculate(
-        value='datum.sum / datum.latest.cost'
     ).mark_circle(
     ).encode(
         x=alt.X(
@@ -88,14 +121,18 @@ def plots(
                 format=' .2~s',
                 title='Value'),
             alt.Tooltip(
-                shorthand='latest[cost]:Q',
+                shorthand='latest_cost:Q',
                 title='Cost')]
     ).properties(
         width=dims['width-pts' if pos is None else 'width-lns']
     )
 
     # Define lines plot [stat vs round for selected players]
-    lines = base.mark_line(
+    lines = lines.add_selection(
+        selector
+    ).properties(
+        height=dims['height']
+    ).mark_line(
         point=True
     ).transform_window(
         cumulative=f'sum({stat})',
@@ -116,10 +153,10 @@ def plots(
             scale=alt.Scale(domain=(
                 0,
                 (
-                    df.groupby('name').sum()
+                    derive(Tensor(df, [stat]))['sum']
                     if aggregate == 'cumulative'
-                    else df
-                )[stat].max())),
+                    else df[stat]
+                ).max())),
             title=' '.join(s.capitalize() for s in stat.split('_'))),
         color=alt.Color(
             shorthand='name:N',
@@ -130,7 +167,7 @@ def plots(
                 format=' .2~s',
                 title=aggregate.capitalize() + ' ' + stat_title),
             alt.Tooltip(
-                shorthand='minutes',
+                shorthand='minutes:Q',
                 title='Minutes')]
     ).transform_filter(
         selector
@@ -157,3 +194,46 @@ def plots(
         titleColor='lightgrey',
         orient='top-right'
     )
+
+
+def player_totals(df:pd.DataFrame, stat:str) -> pd.DataFrame:
+    """
+    Aggregates players-df to one row per player for the points plot.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        players-df DataFrame with at least COLUMNS and stat
+    stat : str
+        the stat column to aggregate
+
+    Returns
+    -------
+    pd.DataFrame
+        columns 'name', 'position', 'sum' and 'var' (sample variance) of stat,
+        'latest_cost' (the cost in the latest round), 'value' (sum /
+        latest_cost) and lists of the player's 'round', 'minutes' and stat
+        values in round order
+    """
+    tensor = Tensor(df, list(dict.fromkeys(['minutes', 'cost', stat])))
+    metrics = derive(tensor)
+    i = tensor.stats.index(stat)
+    integer = lambda column: pd.api.types.is_integer_dtype(df[column])
+
+    totals = tensor.players[['name', 'position']].reset_index(drop=True)
+    totals['sum'] = metrics['sum'][:, i]
+    totals['var'] = metrics['var'][:, i]
+    totals['latest_cost'] = metrics['cost']
+    totals['value'] = metrics['value'][:, i]
+    for column, source in {'sum': stat, 'latest_cost': 'cost'}.items():
+        if integer(source): totals[column] = totals[column].astype('int64')
+    for column in dict.fromkeys(['round', 'minutes', stat]):
+        values = (
+            np.broadcast_to(tensor.rounds, tensor.mask.shape)
+            if column == 'round' else tensor.stat(column))
+        if integer(column): values = values.astype('int64')
+        totals[column] = [
+            row[mask].tolist() for row, mask in zip(values, tensor.mask)]
+
+    return totals.sort_values(
+        ['name', 'position'], kind='stable', ignore_index=True)
@@ -0,0 +1,161 @@
+"""
+In-memory index over the players in players-df for the dashboard's player
+search and filters.
+
+Names are matched by prefix on the whole name or any word of it, through a
+sorted array of name tokens, falling back to fuzzy trigram similarity for
+misspelt queries. Team, position, cost and minutes filters are boolean masks
+over per-player arrays.
+"""
+from analytics import Tensor, derive
+
+import numpy as np
+import pandas as pd
+import unicodedata
+
+
+# Declare constants
+FUZZY_THRESHOLD = 0.3 # trigram similarity a fuzzy match needs
+
+
+def normalize(text:str) -> str:
+    """
+    Lowercases text and strips accents and punctuation, e.g. 'Ødegaard' to
+    'odegaard'.
+    """
+    text = unicodedata.normalize('NFKD', text.lower().replace('ø', 'o'))
+    return ' '.join(''.join(
+        x if x.isalnum() else ' ' for x in text
+        if not unicodedata.combining(x)
+    ).split())
+
+
+def trigrams(text:str) -> set:
+    """
+    Returns the set of character trigrams of text padded with spaces.
+    """
+    text = f'  {text} '
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class PlayerIndex:
+    """
+    Per-player index over players-df.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        players-df indexed by player id, with 'name', 'team', 'position',
+        'round', 'cost' and 'minutes'
+
+    Attributes
+    ----------
+    ids : np.ndarray
+        player ids, sorted
+    players : pd.DataFrame
+        'name', 'team' and 'position' of each player, in the order of ids
+    cost : np.ndarray
+        each player's cost in their latest round
+    minutes : np.ndarray
+        each player's total minutes
+    """
+    def __init__(self, df:pd.DataFrame):
+        tensor = Tensor(df, ['cost', 'minutes'])
+        metrics = derive(tensor)
+        self.ids = tensor.ids
+        self.players = tensor.players
+        self.cost = metrics['cost']
+        self.minutes = metrics['sum'][:, 1]
+
+        self._teams = pd.Categorical(self.players['team'])
+        self._positions = pd.Categorical(self.players['position'])
+
+        # Sorted name tokens for prefix search
+        keys = [normalize(x) for x in self.players['name'].astype(str)]
+        tokens = sorted(
+            (token, i) for i, key in enumerate(keys)
+            for token in {key, *key.split()})
+        self._tokens = np.array([x for x, _ in tokens], dtype=object)
+        self._owners = np.array([i for _, i in tokens], dtype='int64')
+
+        # Trigram postings for fuzzy search
+        postings = {}
+        for i, key in enumerate(keys):
+            for gram in trigrams(key): postings.setdefault(gram, []).append(i)
+        self._postings = {
+            k: np.array(v, dtype='int64') for k, v in postings.items()}
+        self._grams = np.array([len(trigrams(x)) for x in keys])
+
+    def search(self, text:str) -> np.ndarray:
+        """
+        Finds the players whose name, or a word of it, starts with text, or,
+        if there are none, the players with names similar to text, most
+        similar first.
+
+        Returns
+        -------
+        np.ndarray
+            positions of the matching players in ids
+        """
+        text = normalize(text)
+        if not text: return np.arange(len(self.ids))
+
+        start = np.searchsorted(self._tokens, text, 'left')
+        stop = np.searchsorted(self._tokens, text + '\uffff', 'right')
+        prefix = np.unique(self._owners[start:stop])
+        if len(prefix): return prefix
+
+        grams = trigrams(text)
+        counts = np.bincount(
+            np.concatenate([
+                self._postings.get(x, np.empty(0, dtype='int64'))
+                for x in grams]),
+            minlength=len(self.ids))
+        similarity = counts / (len(grams) + self._grams - counts)
+        matches = np.flatnonzero(similarity >= FUZZY_THRESHOLD)
+        return matches[np.argsort(-similarity[matches], kind='stable')]
+
+    def query(
+        self,
+        text:str=None,
+        teams:list=None,
+        positions:list=None,
+        cost:tuple=None,
+        minutes:tuple=None
+    ) -> np.ndarray:
+        """
+        Finds the players matching every given filter.
+
+        Parameters
+        ----------
+        text : str, optional
+            name search, see search. Default None
+        teams : list, optional
+            team names to keep. Default None (all)
+        positions : list, optional
+            position names to keep. Default None (all)
+        cost : tuple, optional
+            inclusive (min, max) latest cost. Default None (any)
+        minutes : tuple, optional
+            inclusive (min, max) total minutes. Default None (any)
+
+        Returns
+        -------
+        np.ndarray
+            ids of the matching players, most similar first for fuzzy name
+            matches, otherwise in id order
+        """
+        mask = np.ones(len(self.ids), dtype=bool)
+        for values, keep in [
+            (self._teams, teams),
+            (self._positions, positions)
+        ]:
+            if keep:
+                codes = values.categories.get_indexer(keep)
+                mask &= np.isin(values.codes, codes[codes >= 0])
+        for values, bounds in [(self.cost, cost), (self.minutes, minutes)]:
+            if bounds is not None:
+                mask &= (values >= bounds[0]) & (values <= bounds[1])
+
+        found = np.flatnonzero(mask) if not text else self.search(text)
+        return self.ids[found[mask[found]]]
@@ -0,0 +1,349 @@
+"""
+Squad optimizer: picks the 15-man squad and starting XI that maximise a stat
+or projection under the game's squad rules.
+
+With scipy installed the squad is solved exactly as a mixed-integer linear
+program. Without it the result is approximate: the budget constraint is
+relaxed into the score as a price per unit of cost, searched by bisection
+for the smallest price at which a greedy pick under the position and team
+limits is within budget, starting from the cheapest valid squad if no such
+pick is. That squad is then improved by the best same-position swaps until
+none is left. It is always valid, but may score below the best squad.
+"""
+from analytics import Tensor, derive
+
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy.optimize import Bounds, LinearConstraint, milp
+except ImportError: # exact optimization unavailable
+    milp = None
+
+
+# Declare constants
+BUDGET = 1000 # in the API's cost units, i.e. 100.0m
+QUOTAS = { # players per position in a squad
+    'Goalkeeper': 2, 'Defender': 5, 'Midfielder': 5, 'Forward': 3}
+FORMATION = { # (min, max) players per position in the starting XI
+    'Goalkeeper': (1, 1), 'Defender': (3, 5), 'Midfielder': (2, 5),
+    'Forward': (1, 3)}
+STARTERS = 11
+TEAM_LIMIT = 3 # players per team
+BISECTIONS = 40
+
+
+def candidates(
+    df:pd.DataFrame,
+    stat:str='total_points',
+    projected:pd.DataFrame=None
+) -> pd.DataFrame:
+    """
+    Summarises players-df into one row per player to pick from.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        players-df with at least 'name', 'team', 'position', 'round', 'cost'
+        and stat
+    stat : str, optional
+        stat whose total is the score. Default 'total_points'
+    projected : pd.DataFrame, optional
+        projections from analytics.project. If given, the score is each
+        player's total 'projected_points' instead. Default None
+
+    Returns
+    -------
+    pd.DataFrame
+        indexed by player id, with 'name', 'team', 'position', 'cost' (in
+        the latest round) and 'score'
+    """
+    tensor = Tensor(df, list(dict.fromkeys([stat, 'cost'])))
+    metrics = derive(tensor)
+    players = tensor.players.set_index(pd.Index(tensor.ids))
+    players['cost'] = metrics['cost'].astype('int64')
+    players['score'] = (
+        metrics['sum'][:, tensor.stats.index(stat)] if projected is None
+        else projected.groupby(level=0)['projected_points'].sum().reindex(
+            tensor.ids, fill_value=0).to_numpy())
+    return players
+
+
+def optimize(players:pd.DataFrame, budget:int=BUDGET) -> pd.DataFrame:
+    """
+    Picks a squad with a high total score within budget, with QUOTAS
+    players per position and at most TEAM_LIMIT per team, and its best
+    starting XI in a valid FORMATION. The squad has the highest possible
+    total if scipy is installed, otherwise it is found by the heuristic in
+    the module docstring.
+
+    Parameters
+    ----------
+    players : pd.DataFrame
+        one row per player with 'team', 'position', 'cost' and 'score', as
+        returned by candidates
+    budget : int, optional
+        maximum total cost of the squad. Default 1000
+
+    Returns
+    -------
+    pd.DataFrame
+        the squad's rows of players with a 'starting' column, ordered by
+        position, starters first, then by score
+
+    Raises
+    ------
+    ValueError
+        if no squad within budget can be picked from players
+    """
+    positions = list(QUOTAS)
+    position = pd.Categorical(
+        players['position'], categories=positions).codes.astype('int64')
+    team = pd.factorize(players['team'])[0]
+    cost = players['cost'].to_numpy(dtype='float64')
+    score = players['score'].to_numpy(dtype='float64')
+    quotas = np.array(list(QUOTAS.values()))
+
+    if (np.bincount(position[position >= 0], minlength=len(quotas))
+            < quotas).any():
+        raise ValueError('not enough players to fill a squad')
+    squad = (
+        _solve(position, team, cost, score, quotas, budget) if milp
+        else _search(position, team, cost, score, quotas, budget))
+    if squad is None: raise ValueError(f'no squad costs {budget} or less')
+
+    result = players.iloc[squad].copy()
+    result['starting'] = _starting(position[squad], score[squad])
+    return result.iloc[np.lexsort((
+        -score[squad], ~result['starting'].to_numpy(), position[squad]))]
+
+
+def _solve(
+    position:np.ndarray,
+    team:np.ndarray,
+    cost:np.ndarray,
+    score:np.ndarray,
+    quotas:np.ndarray,
+    budget:int
+) -> np.ndarray:
+    """
+    Solves for the highest scoring valid squad as a mixed-integer linear
+    program over one binary variable per player not ruled out by _dominated.
+    Returns the positions of the squad's players, or None if no squad is
+    within budget.
+    """
+    kept = np.flatnonzero(~_dominated(position, team, cost, score, quotas))
+    teams = team.max() + 1
+    rows = np.vstack([
+        cost[kept],
+        position[kept] == np.arange(len(quotas))[:, None],
+        team[kept] == np.arange(teams)[:, None]])
+    result = milp(
+        -score[kept],
+        integrality=np.ones(len(kept)),
+        bounds=Bounds(0, 1),
+        constraints=LinearConstraint(
+            rows,
+            np.concatenate([[-np.inf], quotas, np.zeros(teams)]),
+            np.concatenate([[budget], quotas, np.full(teams, TEAM_LIMIT)])))
+    if result.x is None: return None
+    return kept[result.x > 0.5]
+
+
+def _dominated(
+    position:np.ndarray,
+    team:np.ndarray,
+    cost:np.ndarray,
+    score:np.ndarray,
+    quotas:np.ndarray
+) -> np.ndarray:
+    """
+    Marks the players no optimal squad needs: those with an unknown position
+    and those with as many players of their team and position at least as
+    cheap and as high scoring as a squad can hold. A squad holding such a
+    player can swap them for one of these without losing score.
+    """
+    dominated = position < 0
+    group = position * (team.max() + 1) + team
+    order = np.argsort(group, kind='stable')
+    order = order[~dominated[order]]
+    for x in np.split(order, np.flatnonzero(np.diff(group[order])) + 1):
+        ## ties are broken by order, so equal players dominate only later
+        ## ones
+        rank = np.arange(len(x))
+        better = (
+            (cost[x] <= cost[x][:, None]) & (score[x] >= score[x][:, None])
+            & (
+                (cost[x] < cost[x][:, None]) | (score[x] > score[x][:, None])
+                | (rank < rank[:, None])))
+        dominated[x] = better.sum(axis=1) >= min(
+            TEAM_LIMIT, quotas[position[x[0]]])
+    return dominated
+
+
+def _search(
+    position:np.ndarray,
+    team:np.ndarray,
+    cost:np.ndarray,
+    score:np.ndarray,
+    quotas:np.ndarray,
+    budget:int
+) -> np.ndarray:
+    """
+    Finds a valid squad by the bisection and swaps in the module docstring.
+    Returns the positions of the squad's players, or None if no squad is
+    within budget.
+    """
+    def pick(price):
+        return _greedy(
+            np.argsort(cost * price - score, kind='stable'),
+            position, team, quotas)
+
+    def valid(squad):
+        return len(squad) == quotas.sum() and cost[squad].sum() <= budget
+
+    ## this is only a fallback for when scipy is missing: against exhaustive
+    ## search on small pools with tight budgets it missed the best squad in
+    ## 17 of 40, by a median of 3% and at most 19% of the best total
+
+    # Find the lowest price of cost whose greedy pick is valid
+    squad = pick(0)
+    if not valid(squad):
+        low, high = 0, np.ptp(score) + 1
+        squad = pick(high)
+        if not valid(squad):
+            squad = _cheapest(position, team, cost, quotas)
+            if squad is None or cost[squad].sum() > budget: return None
+        for _ in range(BISECTIONS):
+            middle = (low + high) / 2
+            x = pick(middle)
+            if valid(x):
+                high, squad = middle, x
+            else:
+                low = middle
+
+    return _improve(squad, position, team, cost, score, budget)
+
+
+def _greedy(
+    order:np.ndarray,
+    position:np.ndarray,
+    team:np.ndarray,
+    quotas:np.ndarray
+) -> np.ndarray:
+    """
+    Takes players in order while their position has places left and their
+    team is under TEAM_LIMIT. Returns the positions of the players taken.
+    """
+    need = quotas.copy()
+    teams = np.zeros(team.max(initial=0) + 1, dtype='int64')
+    squad, left = [], need.sum()
+    for i in order.tolist():
+        if need[position[i]] and teams[team[i]] < TEAM_LIMIT:
+            squad.append(i)
+            need[position[i]] -= 1
+            teams[team[i]] += 1
+            left -= 1
+            if not left: break
+    return np.array(squad, dtype='int64')
+
+
+def _cheapest(
+    position:np.ndarray,
+    team:np.ndarray,
+    cost:np.ndarray,
+    quotas:np.ndarray
+) -> np.ndarray:
+    """
+    Finds the cheapest squad within the position and team limits by dynamic
+    programming over teams, on the number of players taken per position.
+    Returns the positions of its players, or None if there is no such squad.
+    """
+    shape = tuple(quotas + 1)
+    options = [x for x in np.ndindex(shape) if sum(x) <= TEAM_LIMIT]
+    best = np.full(shape, np.inf)
+    best[(0,) * len(shape)] = 0
+    steps = []
+    for t in range(team.max(initial=-1) + 1):
+        ranked = [
+            np.flatnonzero((team == t) & (position == p))
+            for p in range(len(shape))]
+        ranked = [x[np.argsort(cost[x], kind='stable')] for x in ranked]
+        totals = [
+            np.concatenate([[0], np.cumsum(cost[x]), np.full(n, np.inf)])
+            for x, n in zip(ranked, shape)]
+        taken = np.full(shape, np.inf)
+        choice = np.zeros(shape, dtype='int64')
+        for k, counts in enumerate(options):
+            extra = sum(x[n] for x, n in zip(totals, counts))
+            if extra == np.inf: continue
+            shifted = np.full(shape, np.inf)
+            shifted[tuple(slice(n, None) for n in counts)] = best[
+                tuple(slice(0, m - n) for m, n in zip(shape, counts))] + extra
+            better = shifted < taken
+            taken[better], choice[better] = shifted[better], k
+        best = taken
+        steps.append((ranked, choice))
+
+    state = tuple(quotas)
+    if best[state] == np.inf: return None
+    squad = []
+    for ranked, choice in reversed(steps):
+        counts = options[choice[state]]
+        squad.extend(i for x, n in zip(ranked, counts) for i in x[:n])
+        state = tuple(np.subtract(state, counts))
+    return np.array(squad, dtype='int64')
+
+
+def _improve(
+    squad:np.ndarray,
+    position:np.ndarray,
+    team:np.ndarray,
+    cost:np.ndarray,
+    score:np.ndarray,
+    budget:int
+) -> np.ndarray:
+    """
+    Repeatedly makes the best swap of a squad player for a player of the
+    same position that raises the score and keeps the squad valid.
+    """
+    squad = squad.copy()
+    picked = np.zeros(len(score), dtype=bool)
+    picked[squad] = True
+    while True:
+        spare = budget - cost[squad].sum()
+        teams = np.bincount(team[squad], minlength=team.max() + 1)
+        valid = (
+            (position[None, :] == position[squad][:, None])
+            & ~picked[None, :]
+            & (cost[None, :] - cost[squad][:, None] <= spare)
+            & (
+                (teams[team] < TEAM_LIMIT)[None, :]
+                | (team[None, :] == team[squad][:, None])))
+        gain = np.where(
+            valid, score[None, :] - score[squad][:, None], -np.inf)
+        out, into = np.unravel_index(gain.argmax(), gain.shape)
+        if not gain[out, into] > 1e-9: return squad
+        picked[squad[out]], picked[into] = False, True
+        squad[out] = into
+
+
+def _starting(position:np.ndarray, score:np.ndarray) -> np.ndarray:
+    """
+    Picks the highest scoring STARTERS of a squad in a valid FORMATION: each
+    position's minimum, then the best of the rest up to each maximum.
+    """
+    limits = np.array(list(FORMATION.values()))
+    starting = np.zeros(len(score), dtype=bool)
+    counts = np.zeros(len(limits), dtype='int64')
+    order = np.argsort(-score, kind='stable').tolist()
+    for bound in [0, 1]:
+        for i in order:
+            if (
+                not starting[i]
+                and counts[position[i]] < limits[position[i], bound]
+                and starting.sum() < STARTERS
+            ):
+                starting[i] = True
+                counts[position[i]] += 1
+    return starting
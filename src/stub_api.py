@@ -0,0 +1,239 @@
+"""
+Local stub of the fantasy epl API serving synthetic data, for exercising
+get_data without hitting the real API.
+
+Usage: python stub_api.py [--port 8000] [--players 600] [--rounds 38]
+                          [--latency 0.05] [--failure-rate 0.05]
+then run get_data.py with FPL_API_URL=http://localhost:8000/api/
+"""
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from time import sleep
+
+import hashlib
+import json
+import random
+import re
+
+
+# Declare constants
+STATS = [
+    'total_points', 'minutes', 'goals_scored', 'assists', 'clean_sheets',
+    'goals_conceded', 'own_goals', 'penalties_saved', 'penalties_missed',
+    'yellow_cards', 'red_cards', 'saves', 'bonus', 'bps', 'value', 'selected']
+POSITIONS = [
+    ('Goalkeeper', 'GKP'), ('Defender', 'DEF'),
+    ('Midfielder', 'MID'), ('Forward', 'FWD')]
+
+
+def make_payloads(
+    players:int=600,
+    rounds:int=38,
+    seed:int=0,
+    year:int=2022,
+    upcoming:int=5
+) -> dict:
+    """
+    Generates synthetic bootstrap-static, fixtures and element-summary
+    payloads for the season starting in year. One fixture in every tenth
+    round is postponed to the next round, giving its teams a blank and then
+    a double gameweek. About one player in twenty moved club during the
+    season, so their earlier matches are for their former team. A further
+    upcoming rounds of fixtures are scheduled but unplayed. Returns a dict
+    keyed by API path.
+    """
+    rng = random.Random(seed)
+    teams = [
+        {'id': i, 'name': f'Team {i}', 'short_name': f'T{i:02}',
+         'strength': rng.randint(2, 5)}
+        for i in range(1, 21)]
+
+    fixtures, id = [], 1
+    for round in range(1, rounds + 1):
+        order = rng.sample(range(1, 21), 20)
+        for h, a in zip(order[::2], order[1::2]):
+            fixtures.append({
+                'id': id, 'event': round, 'finished': True,
+                'kickoff_time': f'{year}-08-05T19:00:00Z',
+                'team_h': h, 'team_a': a,
+                'team_h_score': rng.randint(0, 4),
+                'team_a_score': rng.randint(0, 4)})
+            id += 1
+
+    # Postpone the first fixture of every tenth round to the next round
+    for fixture in fixtures[::10]:
+        if fixture['event'] % 10 == 5 and fixture['event'] < rounds:
+            fixture['event'] += 1
+    schedule = {
+        team: [
+            x for x in sorted(fixtures, key=lambda x: (x['event'], x['id']))
+            if team in (x['team_h'], x['team_a'])]
+        for team in range(1, 21)}
+
+    elements, summaries = [], {}
+    for id in range(1, players + 1):
+        team = rng.randint(1, 20)
+        former, moved = (
+            (rng.randint(1, 20), rng.randint(2, rounds))
+            if rng.random() < 0.05 else (team, 1))
+        played = [
+            (fixture, former)
+            for fixture in schedule[former] if fixture['event'] < moved
+        ] + [
+            (fixture, team)
+            for fixture in schedule[team] if fixture['event'] >= moved]
+        elements.append({
+            'id': id, 'code': 100_000 + id,
+            'first_name': f'First{id}', 'second_name': f'Second{id}',
+            'web_name': f'Player {id}', 'team': team,
+            'element_type': rng.randint(1, 4), 'status': 'a',
+            'minutes': rng.randint(1, 90 * rounds),
+            'chance_of_playing_next_round': rng.choice(
+                [None, None, None, 100, 75, 25, 0]),
+            'chance_of_playing_this_round': 100})
+        cost = rng.randint(40, 130)
+        summaries[f'element-summary/{id}/'] = {
+            'history': [
+                {'element': id, 'fixture': fixture['id'],
+                 'opponent_team': fixture[
+                     'team_a' if fixture['team_h'] == side else 'team_h'],
+                 'was_home': fixture['team_h'] == side,
+                 'round': fixture['event'], **{
+                    stat: rng.randint(0, 3) for stat in STATS},
+                 'minutes': rng.choice([0, 45, 90]),
+                 'bps': rng.randint(0, 40),
+                 'value': cost, 'selected': rng.randint(0, 5_000_000)}
+                for fixture, side in played],
+            'history_past': [
+                {'season_name': f'{past}/{(past + 1) % 100:02}',
+                 'element_code': 100_000 + id,
+                 'start_cost': cost, 'end_cost': cost + rng.randint(-5, 5),
+                 **{
+                     stat: rng.randint(0, 3 * rounds)
+                     for stat in STATS if stat not in ['value', 'selected']},
+                 'minutes': rng.randint(0, 90 * rounds)}
+                for past in range(year - rng.randint(0, 3), year)]}
+
+    # Schedule upcoming rounds
+    for round in range(rounds + 1, rounds + upcoming + 1):
+        order = rng.sample(range(1, 21), 20)
+        for h, a in zip(order[::2], order[1::2]):
+            fixtures.append({
+                'id': len(fixtures) + 1, 'event': round, 'finished': False,
+                'kickoff_time': f'{year + 1}-05-05T19:00:00Z',
+                'team_h': h, 'team_a': a,
+                'team_h_score': None, 'team_a_score': None})
+
+    return {
+        'bootstrap-static/': {
+            'teams': teams,
+            'elements': elements,
+            'events': [
+                {'id': round, 'finished': round <= rounds,
+                 'data_checked': round <= rounds}
+                for round in range(1, rounds + upcoming + 1)],
+            'element_types': [
+                {'id': i, 'singular_name': name, 'singular_name_short': short}
+                for i, (name, short) in enumerate(POSITIONS, 1)]},
+        'fixtures/': fixtures,
+        **summaries}
+
+
+def make_seasons(
+    seasons:int=1,
+    seed:int=0,
+    year:int=2022,
+    **kwargs
+) -> list:
+    """
+    Generates payloads for consecutive seasons ending with the season
+    starting in year, each from its own seed. Keyword arguments are passed
+    to make_payloads.
+    """
+    return [
+        make_payloads(seed=seed + i, year=year - seasons + 1 + i, **kwargs)
+        for i in range(seasons)]
+
+
+def make_handler(
+    payloads:dict,
+    latency:float=0,
+    failure_rate:float=0
+) -> type:
+    """
+    Builds a request handler serving payloads under /api/ with ETags,
+    answering a matching If-None-Match with 304. Each request sleeps for
+    latency seconds and fails with 429 or 503 with probability failure_rate.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            sleep(latency)
+            path = re.sub('^/api/', '', self.path)
+            if path not in payloads:
+                status, body = 404, b'{}'
+            elif random.random() < failure_rate:
+                status, body = random.choice([429, 503]), b'{}'
+            else:
+                status, body = 200, json.dumps(payloads[path]).encode()
+
+            etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+            if status == 200 and self.headers.get('If-None-Match') == etag:
+                status, body = 304, b''
+
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            if status in (200, 304): self.send_header('ETag', etag)
+            if status == 429: self.send_header('Retry-After', '0')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *_):
+            pass
+
+    return Handler
+
+
+@contextmanager
+def serve(
+    port:int=0,
+    latency:float=0,
+    failure_rate:float=0,
+    **kwargs
+):
+    """
+    Runs the stub in a background thread and yields its base API url.
+    Keyword arguments are passed to make_payloads.
+    """
+    server = ThreadingHTTPServer(
+        ('127.0.0.1', port),
+        make_handler(make_payloads(**kwargs), latency, failure_rate))
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f'http://127.0.0.1:{server.server_port}/api/'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Serve a stub fantasy epl API.')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--players', type=int, default=600)
+    parser.add_argument('--rounds', type=int, default=38)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--failure-rate', type=float, default=0.05)
+    args = parser.parse_args()
+
+    ThreadingHTTPServer(
+        ('127.0.0.1', args.port),
+        make_handler(
+            make_payloads(args.players, args.rounds),
+            args.latency,
+            args.failure_rate)
+    ).serve_forever()
@@ -0,0 +1,79 @@
+"""
+Interrupts a crawl of the stub API partway through the player requests and
+checks that the re-run resumes from the checkpoint.
+"""
+import json
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from client import Client
+from stub_api import serve
+
+import get_data
+
+
+# Declare constants
+PLAYERS = 60
+ROUNDS = 6
+FETCHED = 20 # players recorded before the crawl is interrupted
+
+
+class Interrupted(Exception):
+    pass
+
+
+@pytest.fixture
+def api(monkeypatch):
+    with serve(players=PLAYERS, rounds=ROUNDS) as url:
+        monkeypatch.setitem(
+            get_data.ENDPOINTS, 'general', f'{url}bootstrap-static/')
+        monkeypatch.setitem(get_data.ENDPOINTS, 'fixtures', f'{url}fixtures/')
+        monkeypatch.setitem(
+            get_data.ENDPOINTS, 'player',
+            lambda player_id: f'{url}element-summary/{player_id}/')
+        yield url
+
+
+def crawl(checkpoint:str=None) -> dict:
+    with Client(concurrency=4, rate=1_000) as client:
+        return get_data._get_data(client, checkpoint=checkpoint)
+
+
+def test_interrupted_crawl_resumes(api, monkeypatch, tmp_path):
+    checkpoint = str(tmp_path / 'crawl.jsonl')
+    get_many = Client.get_many
+
+    # Kill the crawl after FETCHED players are recorded
+    def interrupted(self, urls, callback=None):
+        def save(key, history):
+            if save.calls == FETCHED: raise Interrupted
+            callback(key, history)
+            save.calls += 1
+        save.calls = 0
+        return get_many(self, urls, save)
+
+    monkeypatch.setattr(Client, 'get_many', interrupted)
+    with pytest.raises(Interrupted): crawl(checkpoint)
+    with open(checkpoint) as f:
+        recorded = {json.loads(line)['id'] for line in list(f)[1:]}
+    assert len(recorded) == FETCHED
+
+    # Re-run, recording the players requested
+    requested = set()
+    def recording(self, urls, callback=None):
+        requested.update(urls)
+        return get_many(self, urls, callback)
+
+    monkeypatch.setattr(Client, 'get_many', recording)
+    resumed = crawl(checkpoint)
+    assert requested == set(resumed['players']) - recorded
+    assert not os.path.exists(checkpoint)
+
+    monkeypatch.setattr(Client, 'get_many', get_many)
+    pd.testing.assert_frame_equal(
+        resumed['players-df'], crawl()['players-df'])
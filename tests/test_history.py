@@ -0,0 +1,54 @@
+"""
+Checks the multi-season history store against datasets from the stub API.
+"""
+from contextlib import redirect_stdout
+from io import StringIO
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from benchmarks import ReplayClient
+from get_data import _get_data
+from stub_api import make_payloads
+
+import dataset
+import history
+
+
+@pytest.fixture(scope='module')
+def dat():
+    with redirect_stdout(StringIO()):
+        return _get_data(
+            ReplayClient(make_payloads(players=40, rounds=4)),
+            checkpoint=None)
+
+
+@pytest.fixture
+def store(dat, tmp_path):
+    history.append(dat, path=str(tmp_path))
+    return str(tmp_path)
+
+
+def test_totals_skips_levels(dat, store):
+    stored = history.season_name(dat)
+    seasons = history.totals(path=store)['season'].unique().tolist()
+    assert stored in seasons and len(seasons) > 1
+
+    df = history.totals(
+        stats=['total_points', 'cost', 'selected'], path=store)
+    assert set(df['season']) == set(seasons)
+    assert list(df.columns) == [
+        'season', 'code', 'start_cost', 'end_cost', 'total_points']
+
+
+def test_append_before_the_season_starts(dat, tmp_path):
+    preseason = {
+        **dat,
+        'fixtures': {},
+        'players-df': dataset.apply_schema(dat['players-df'].iloc[:0])}
+    assert not history.append(preseason, path=str(tmp_path))
+    assert history.list_seasons(str(tmp_path)) == []
@@ -0,0 +1,40 @@
+"""
+Checks the per-player aggregates behind the points plot.
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from plots import player_totals
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame(
+        {
+            'name': ['A', 'A', 'A', 'B'],
+            'position': ['Defender', 'Defender', 'Defender', 'Forward'],
+            'round': [1, 2, 2, 1],
+            'minutes': [90, 90, 45, 30],
+            'total_points': [2, 6, 1, 3],
+            'cost': [55, 55, 56, 70]},
+        index=[1, 1, 1, 2])
+
+
+@pytest.mark.parametrize('stat', ['total_points', 'minutes', 'cost'])
+def test_player_totals_latest_cost(df, stat):
+    totals = player_totals(df, stat).set_index('name')
+    assert totals['latest_cost'].tolist() == [56, 70]
+    assert totals.loc['A', 'round'] == [1, 2]
+    if stat == 'cost': assert totals.loc['A', 'cost'] == [55, 56]
+
+
+def test_player_totals_sums_double_gameweeks(df):
+    totals = player_totals(df, 'total_points').set_index('name')
+    assert totals.loc['A', 'sum'] == 9
+    assert totals.loc['A', 'total_points'] == [2, 7]
+    assert totals.loc['A', 'value'] == pytest.approx(9 / 56)
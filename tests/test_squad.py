@@ -0,0 +1,93 @@
+"""
+Checks the squad optimizer against exhaustive search on small player pools.
+"""
+from itertools import combinations, product
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import squad
+
+
+# Declare constants
+POOL = {'Goalkeeper': 3, 'Defender': 7, 'Midfielder': 7, 'Forward': 5}
+TEAMS = 6
+POOLS = 40
+
+
+def make_pool(seed:int) -> tuple:
+    """
+    Generates a random pool of POOL players and a tight budget.
+    """
+    rng = np.random.default_rng(seed)
+    players = pd.DataFrame([
+        {
+            'position': position,
+            'team': int(rng.integers(TEAMS)),
+            'cost': int(rng.integers(40, 130)),
+            'score': float(rng.integers(200))}
+        for position, n in POOL.items() for _ in range(n)])
+    return players, int(rng.integers(900, 1200))
+
+
+def best_total(players:pd.DataFrame, budget:int) -> float:
+    """
+    Finds the highest total score of any valid squad by trying them all, or
+    None if there is none.
+    """
+    position = players['position'].to_numpy()
+    team = players['team'].to_numpy()
+    cost = players['cost'].to_numpy()
+    score = players['score'].to_numpy()
+    best = None
+    for picks in product(*(
+        combinations(np.flatnonzero(position == p), n)
+        for p, n in squad.QUOTAS.items()
+    )):
+        x = np.concatenate(picks)
+        if (
+            cost[x].sum() <= budget
+            and np.bincount(team[x]).max() <= squad.TEAM_LIMIT
+            and (best is None or score[x].sum() > best)
+        ):
+            best = score[x].sum()
+    return best
+
+
+def check(picked:pd.DataFrame, budget:int):
+    assert picked['cost'].sum() <= budget
+    assert picked['team'].value_counts().max() <= squad.TEAM_LIMIT
+    assert picked['position'].value_counts().to_dict() == squad.QUOTAS
+    assert picked['starting'].sum() == squad.STARTERS
+
+
+@pytest.mark.parametrize('seed', range(POOLS))
+def test_solve_is_exact(seed):
+    pytest.importorskip('scipy')
+    players, budget = make_pool(seed)
+    best = best_total(players, budget)
+    if best is None:
+        with pytest.raises(ValueError): squad.optimize(players, budget)
+    else:
+        picked = squad.optimize(players, budget)
+        check(picked, budget)
+        assert picked['score'].sum() == pytest.approx(best)
+
+
+@pytest.mark.parametrize('seed', range(POOLS))
+def test_search_is_valid(seed, monkeypatch):
+    monkeypatch.setattr(squad, 'milp', None)
+    players, budget = make_pool(seed)
+    best = best_total(players, budget)
+    if best is None:
+        with pytest.raises(ValueError): squad.optimize(players, budget)
+    else:
+        picked = squad.optimize(players, budget)
+        check(picked, budget)
+        assert picked['score'].sum() <= best + 1e-9